@@ -1,9 +1,11 @@
 import sys  # used for file reading
+import threading  # paths are computed on a worker thread so slow searches don't freeze the GUI
 import time  # used for timing the path-finding
 import pygame as pg  # used for drawing / event handling
 from settings import *  # use a separate file for all the constant settings
 import grid_solution  # the grid class for this assignment (solution)
 import grid_student  # the grid class for this assignment (student)
+from moving_target import MovingTargetSearch  # reuses searches while the goal follows the mouse
 
 
 class PathFindingDisplay:
@@ -31,35 +33,124 @@ class PathFindingDisplay:
         self.__expanded = set()  # previous computed set of nodes expanded
         self.__path_time = 0  # previous path computation time
         self.__heuristic = 0  # previous computed heuristic value
-        # prerender the map surface, which will never change for a static map
+        self.__planners = {}  # moving target search per object size, worker only
+        # the latest (start, goal, size) asked for, waiting for the worker to pick it up, and the
+        # last one it was given. a newer request replaces a waiting one and cancels a running one
+        self.__request = None
+        self.__requested = None
+        self.__result = None  # the worker's latest (path, cost, expanded, time) result
+        self.__lock = threading.Condition()
+        self.__cancel = threading.Event()
+        worker = threading.Thread(target=self.__path_worker, name="path worker")
+        worker.daemon = True
+        worker.start()
+        self.__overlay = None  # prerendered overlay of the tiles connected to the mouseover tile
+        self.__overlay_mask = None  # the reachable_mask the overlay was drawn from
+        # the static layer is the map with its grid lines, prerendered and redrawn only when the
+        # map changes. the grid lines are also kept on their own so they can go over the path
         self.__map_surface = pg.Surface((self.__width, self.__height))
+        self.__grid_surface = pg.Surface((self.__width, self.__height))
+        self.__grid_surface.set_colorkey(BLACK)
+        self.__map_version = None  # the map version the static layer was drawn for
+        self.__scene = None  # the inputs the path layer was last drawn for
+        self.__scene_rect = None  # the screen area the last path layer covered
+        self.__stats = None  # the lines of text the stats layer was last drawn with
+        self.__stats_rect = None  # the screen area the last stats layer covered
+        self.__texts = {}  # rendered text surfaces by string, the labels rarely change
+
+    # draw the static map and grid line layers
+    def __draw_map(self):
+        self.__map_surface.fill(BLACK)
+        self.__grid_surface.fill(BLACK)
         for x in range(self.__grid.width()):
             for y in range(self.__grid.height()):
                 self.__draw_tile(self.__map_surface, (x, y), TILE_COLOR[self.__grid.get((x, y))],
                                  1)
+        for x in range(self.__grid.width()):
+            pg.draw.line(self.__grid_surface, GRID_COLOR, (x * TILE_SIZE, 0),
+                         (x * TILE_SIZE, self.__height))
+        for y in range(self.__grid.height()):
+            pg.draw.line(self.__grid_surface, GRID_COLOR, (0, y * TILE_SIZE),
+                         (self.__width, y * TILE_SIZE))
+        self.__map_surface.blit(self.__grid_surface, (0, 0))
+        self.__map_version = self.__grid.version()
 
     # game main loop update function
     def update(self):
         self.__events()  # handle all mouse and keyboard events
         self.__compute_path()  # compute a path if we need to
         self.__draw()  # draw everything to the screen
+        self.__clock.tick(FPS)  # sleep off the rest of the frame instead of spinning
 
-    # draw everything to the screen
+    # draw everything that changed since the last frame to the screen
+    # the screen is built from the static map layer, the path layer (connected tiles, expanded
+    # tiles and the path) and the stats layer. each frame works out which layers' inputs changed,
+    # redraws the screen areas they covered before and cover now, and pushes only those areas
     def __draw(self):
-        self.__screen.blit(self.__map_surface, (0, 0))
+        dirty = []
+        if self.__map_version != self.__grid.version():
+            self.__draw_map()
+            dirty.append(self.__screen.get_rect())
+        scene = (self.__s_tile, self.__m_tile, self.__o_size, self.__m_down[2], self.__path,
+                 self.__expanded)
+        if scene != self.__scene:
+            rect = self.__path_rect()
+            dirty.append(rect.union(self.__scene_rect) if self.__scene_rect else rect)
+            self.__scene, self.__scene_rect = scene, rect
+        stats = self.__stats_lines()
+        if stats != self.__stats:
+            rect = self.__text_rect(stats)
+            dirty.append(rect.union(self.__stats_rect) if self.__stats_rect else rect)
+            self.__stats, self.__stats_rect = stats, rect
+        for rect in dirty:
+            self.__compose(rect)
+        pg.display.update(dirty)
+
+    # redraw every layer inside one area of the screen
+    def __compose(self, rect):
+        self.__screen.set_clip(rect)
+        self.__screen.blit(self.__map_surface, rect, rect)
         self.__draw_connected()
         self.__draw_path()
-        self.__draw_grid_lines()
+        self.__screen.blit(self.__grid_surface, rect, rect)
         self.__draw_stats()
-        pg.display.flip()
+        self.__screen.set_clip(None)
+
+    # returns the screen area covered by the path layer
+    def __path_rect(self):
+        if self.__m_down[2]:
+            return self.__screen.get_rect()
+        tiles = [self.__m_tile]
+        if self.__s_tile != (-1, -1):
+            tiles.append(self.__s_tile)
+            current = self.__s_tile
+            for action in self.__path:
+                current = (current[0] + action[0], current[1] + action[1])
+                tiles.append(current)
+        tiles.extend(self.__expanded)
+        x0, x1 = min(tile[0] for tile in tiles), max(tile[0] for tile in tiles)
+        y0, y1 = min(tile[1] for tile in tiles), max(tile[1] for tile in tiles)
+        return pg.Rect(x0 * TILE_SIZE, y0 * TILE_SIZE, (x1 - x0 + self.__o_size) * TILE_SIZE,
+                       (y1 - y0 + self.__o_size) * TILE_SIZE).clip(self.__screen.get_rect())
 
     # draw the all the tiles that are connected (path possible) from the mouseover tile
     def __draw_connected(self):
         if self.__m_down[2]:  # only draw if we're holding down the right mouse button
-            for x in range(self.__grid.width()):
-                for y in range(self.__grid.height()):
-                    if self.__grid.is_connected(self.__m_tile, (x, y), self.__o_size):
-                        self.__draw_tile(self.__screen, (x, y), PURPLE, self.__o_size)
+            self.__screen.blit(self.__connected_overlay(), (0, 0))
+
+    # returns a surface with the tiles connected to the mouseover tile drawn on it, the same for
+    # every tile of a sector. reachable_mask hands back the same mask object for the whole sector
+    # until the map or the size changes, so the overlay is only redrawn when the mask does
+    def __connected_overlay(self):
+        mask = self.__grid.reachable_mask(self.__m_tile, self.__o_size)
+        if mask is not self.__overlay_mask:
+            overlay = pg.Surface((self.__width, self.__height))
+            overlay.set_colorkey(BLACK)
+            for cell in range(len(mask)):
+                if mask[cell]:
+                    self.__draw_tile(overlay, self.__grid.tile_of(cell), PURPLE, self.__o_size)
+            self.__overlay, self.__overlay_mask = overlay, mask
+        return self.__overlay
 
     # draw the path and expanded tiles
     def __draw_path(self):
@@ -76,40 +167,72 @@ class PathFindingDisplay:
         if self.__s_tile != (-1, -1):
             self.__draw_tile(self.__screen, self.__s_tile, YELLOW, self.__o_size)
 
+    # returns the lines of statistics to draw, one for each row of the stats layer
+    def __stats_lines(self):
+        return (str(self.__s_tile) + " " + str(self.__m_tile),
+                "Expanded:  " + str(len(self.__expanded)),
+                "Heuristic: " + str(self.__heuristic),
+                "Path Cost: " + str(self.__path_cost),
+                "Path Time: " + str(int(self.__path_time * 1000)) + "ms")
+
+    # returns the screen area covered by the given lines of statistics
+    def __text_rect(self, lines):
+        return pg.Rect(10, self.__height - 100, 0, 0).unionall(
+            [self.__text(text).get_rect(topleft=(10, self.__height - 100 + 20 * i))
+             for i, text in enumerate(lines)])
+
     # draw some statistics to the screen
     def __draw_stats(self):
-        self.__draw_text(str(self.__s_tile) + " " + str(self.__m_tile), (10, self.__height - 100),
-                         FONT_COLOR)
-        self.__draw_text("Expanded:  " + str(len(self.__expanded)), (10, self.__height - 80),
-                         FONT_COLOR)
-        self.__draw_text("Heuristic: " + str(self.__heuristic), (10, self.__height - 60),
-                         FONT_COLOR)
-        self.__draw_text("Path Cost: " + str(self.__path_cost), (10, self.__height - 40),
-                         FONT_COLOR)
-        self.__draw_text("Path Time: " + str(int(self.__path_time * 1000)) + "ms",
-                         (10, self.__height - 20), FONT_COLOR)
-
-    # draw the grid lines
-    def __draw_grid_lines(self):
-        for x in range(self.__grid.width()):
-            pg.draw.line(self.__screen, GRID_COLOR, (x * TILE_SIZE, 0),
-                         (x * TILE_SIZE, self.__height))
-        for y in range(self.__grid.height()):
-            pg.draw.line(self.__screen, GRID_COLOR, (0, y * TILE_SIZE),
-                         (self.__width, y * TILE_SIZE))
+        for i, text in enumerate(self.__stats):
+            self.__screen.blit(self.__text(text), (10, self.__height - 100 + 20 * i))
 
-    # computes and stores a path if we have the left mouse button held down
+    # asks the worker for a path if we have the left mouse button held down, and shows the last
+    # path it finished until a newer one comes in
     def __compute_path(self):
-        self.__path, self.__path_cost, self.__expanded, self.__path_time, self.__heuristic = [], \
-                                                                                             0, \
-                                                                                             set(), 0, 0
-        if self.__m_down[0]:
-            t0 = time.clock()
-            self.__path, self.__path_cost, self.__expanded = self.__grid.get_path(self.__s_tile,
-                                                                                  self.__m_tile,
-                                                                                  self.__o_size)
-            self.__heuristic = self.__grid.estimate_cost(self.__s_tile, self.__m_tile)
-            self.__path_time = time.clock() - t0
+        if not self.__m_down[0]:
+            self.__submit(None)
+            if self.__path or self.__expanded:
+                self.__path, self.__path_cost, self.__expanded, self.__path_time, \
+                    self.__heuristic = [], 0, set(), 0, 0
+            return
+        self.__submit((self.__s_tile, self.__m_tile, self.__o_size))
+        with self.__lock:
+            result = self.__result
+        if result is not None:
+            self.__path, self.__path_cost, self.__expanded, self.__path_time = result
+        self.__heuristic = self.__grid.estimate_cost(self.__s_tile, self.__m_tile)
+
+    # hand a new (start, goal, size) request to the worker, or None to stop showing a path
+    # requests are coalesced: only the latest one matters, so it replaces any waiting request and
+    # cancels the search that is running, whose result would be stale by the time it finished
+    def __submit(self, request):
+        if request == self.__requested:
+            return
+        with self.__lock:
+            self.__requested = self.__request = request
+            self.__result = None if request is None else self.__result
+            self.__cancel.set()
+            self.__lock.notify()
+
+    # the worker thread, computes the latest requested path and publishes it as the result
+    def __path_worker(self):
+        while True:
+            with self.__lock:
+                while self.__request is None:
+                    self.__lock.wait()
+                start, goal, size = request = self.__request
+                self.__request = None
+                self.__cancel.clear()
+            t0 = time.perf_counter()
+            # the goal follows the mouse and usually moves a tile at a time, so keep a planner per
+            # object size that learns from its previous searches instead of starting a new one
+            # every frame, switching sizes back and forth keeps what each of them has learned
+            if size not in self.__planners:
+                self.__planners[size] = MovingTargetSearch(self.__grid, size)
+            result = self.__planners[size].find_path(start, goal, self.__cancel)
+            with self.__lock:
+                if result is not None and request == self.__requested:
+                    self.__result = result + (time.perf_counter() - t0,)
 
             # draw a tile location with given parameters
 
@@ -117,10 +240,13 @@ class PathFindingDisplay:
         surface.fill(color, (
             tile[0] * TILE_SIZE, tile[1] * TILE_SIZE, TILE_SIZE * size, TILE_SIZE * size))
 
-    # draws text to the screen at a given location
-    def __draw_text(self, text, pos, color):
-        label = self.__font.render(text, 1, color)
-        self.__screen.blit(label, pos)
+    # returns the rendered surface of a line of text, rendering it only the first time it is seen
+    def __text(self, text):
+        if text not in self.__texts:
+            if len(self.__texts) > 256:
+                self.__texts.clear()  # mostly mouse coordinates that have moved on
+            self.__texts[text] = self.__font.render(text, 1, FONT_COLOR)
+        return self.__texts[text]
 
     # returns the tile on the grid underneath a given mouse position in pixels
     def __get_tile(self, mpos):
@@ -0,0 +1,192 @@
+import heapq
+
+from settings import *  # use a separate file for all the constant settings
+from grid_student import cell_moves
+
+WAIT = (0, 0)  # the action of an agent that stays where it is for one step
+
+
+# windowed hierarchical cooperative A* (WHCA*) for many objects sharing one Grid
+# agents are planned one after another through space and time. every step of a planned path
+# reserves the tiles under the object's size x size footprint in a reservation table keyed by
+# (cell, time), so the agents planned later route around the earlier ones instead of colliding
+# with them. each search only looks window steps ahead, and its heuristic is the exact distance
+# to the agent's goal on the static map, read from the Grid's backward distance fields
+# the order the agents are planned in rotates every window so no agent is always yielding, and
+# solve() moves agents that stop getting closer to their goals to the front of it, so that two
+# agents meeting head on in a corridor don't wait for each other forever
+class CooperativePlanner:
+    def __init__(self, grid, window=COOPERATIVE_WINDOW):
+        self.grid = grid
+        self.window = window
+        self.width, self.height = grid.width(), grid.height()
+        self.reserved = {}  # reserved[(cell, time)] = the agent whose footprint covers the cell
+        self.moves = {}  # moves[(from cell, to cell, time)] = the agent taking that step
+        # how many distance fields the Grid is asked to keep, one per (goal, size) of the agents
+        self.capacity = FIELD_CACHE_SIZE
+        self.first = 0  # the agent planned first in the next window
+
+    # returns the cells covered by an object of a given size standing on a cell
+    def footprint(self, cell, size):
+        width = self.width
+        return [cell + dy * width + dx for dy in range(size) for dx in range(size)]
+
+    def __reserve(self, agent, cell, size, time):
+        for c in self.footprint(cell, size):
+            self.reserved[(c, time)] = agent
+
+    # returns true if an agent may stand on cell at a given time without touching another agent
+    def __free(self, agent, cell, size, time):
+        reserved = self.reserved
+        for c in self.footprint(cell, size):
+            if reserved.get((c, time), agent) != agent:
+                return False
+        return True
+
+    # returns the cost to goal from every cell for an object of the given size, -1 where the goal
+    # can't be reached from, read from the Grid's distance fields
+    def costs(self, goal, size):
+        return self.grid.distance_field(self.grid.tile_of(goal), size, self.capacity).costs
+
+    # make room in the Grid's distance field cache for the goal of every agent, otherwise going
+    # through more goals than it holds in turn would evict each field just before it is needed
+    def __keep_fields(self, agents):
+        self.capacity = max(FIELD_CACHE_SIZE, len(set((goal, size) for _, goal, size in agents)))
+
+    # plan the next window for every agent, given as (start, goal, size) triples, and return
+    # their action lists in the same order. an action list holds up to window actions, with
+    # WAIT for the steps an agent stays in place
+    # the agents listed in first are planned before all the others, in that order
+    def plan(self, agents, first=()):
+        self.__keep_fields(agents)
+        cells = [self.grid.cell_of(start) for start, goal, size in agents]
+        count = len(agents)
+        order = list(first) + [agent for agent in ((self.first + i) % count for i in range(count))
+                               if agent not in first]
+        self.first = (self.first + 1) % max(count, 1)
+        # an agent that can't find a way through the window stays where it is, which the agents
+        # planned before it didn't know about, so plan the window again with it pinned in place
+        stuck = set()
+        while True:
+            self.reserved.clear()
+            self.moves.clear()
+            for agent, (start, goal, size) in enumerate(agents):
+                # nobody may walk into an agent before it has had a chance to move away
+                last = self.window if agent in stuck else 1
+                for time in range(last + 1):
+                    self.__reserve(agent, cells[agent], size, time)
+            paths = [[] for _ in agents]
+            for agent in order:
+                if agent in stuck:
+                    continue
+                start, goal, size = agents[agent]
+                path = self.__search(agent, cells[agent], self.grid.cell_of(goal), size)
+                if path is None:
+                    stuck.add(agent)
+                    break
+                paths[agent] = path
+                # reserve the footprint along the path and at its last tile to the window end
+                cell = cells[agent]
+                for time, (dx, dy) in enumerate(path, 1):
+                    nxt = cell + dy * self.width + dx
+                    self.moves[(cell, nxt, time - 1)] = agent
+                    cell = nxt
+                    self.__reserve(agent, cell, size, time)
+                for time in range(len(path) + 1, self.window + 1):
+                    self.__reserve(agent, cell, size, time)
+            else:
+                return paths
+
+    # space-time A* for one agent over (cell, time) states up to the window, returns the actions
+    # of the cheapest route that respects the reservations, staying at the goal costs nothing
+    # returns None if the agent is boxed in, and [] if it can never reach its goal
+    def __search(self, agent, start, goal, size):
+        field = self.costs(goal, size)
+        width, height, window = self.width, self.height, self.window
+        labels = self.grid.sectors(size)
+        label = labels[start]
+        if label == 0 or field[start] < 0:
+            return []
+        moves = cell_moves(width) + [(-1, 0, 0, 0, CARDINAL_COST)]
+
+        g = {(start, 0): 0}
+        parent = {(start, 0): None}
+        open_list = [(field[start], 0, start, 0)]
+        best = None
+        while open_list:
+            f, neg_g, cell, time = heapq.heappop(open_list)
+            state = (cell, time)
+            if -neg_g > g[state]:
+                continue
+            if time == window:
+                best = state
+                break
+            y, x = divmod(cell, width)
+            for i, dx, dy, offset, cost in moves:
+                if not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                child = cell + offset
+                if labels[child] != label:
+                    continue
+                if dx and dy and (labels[cell + dx] != label or labels[cell + dy * width] != label):
+                    continue
+                if not self.__free(agent, child, size, time + 1):
+                    continue
+                # two agents may not swap places through each other
+                if child != cell and self.moves.get((child, cell, time), agent) != agent:
+                    continue
+                if i < 0 and cell == goal:
+                    cost = 0
+                new_g = g[state] + cost
+                child_state = (child, time + 1)
+                if new_g < g.get(child_state, new_g + 1):
+                    g[child_state], parent[child_state] = new_g, (state, i)
+                    heapq.heappush(open_list, (new_g + field[child], -new_g, child, time + 1))
+        if best is None:
+            return None
+        path = []
+        while parent[best] is not None:
+            best, i = parent[best]
+            path.append(WAIT if i < 0 else LEGAL_ACTIONS[i])
+        return path[::-1]
+
+    # plan every agent all the way to its goal, executing half of each window before planning the
+    # next one, and return their full action lists along with whether each agent got to its goal.
+    # gives up after max_steps steps
+    # an agent that hasn't come any closer to its goal for a whole executed half window is stalled,
+    # usually by agents coming the other way, and is planned ahead of every agent that stalled
+    # after it until it arrives, so the others plan around it and make way
+    def solve(self, agents, max_steps=None):
+        max_steps = max_steps or 4 * (self.width + self.height)
+        self.__keep_fields(agents)
+        positions = [start for start, goal, size in agents]
+        paths = [[] for _ in agents]
+        best = [self.costs(self.grid.cell_of(goal), size)[self.grid.cell_of(start)]
+                for start, goal, size in agents]  # the closest each agent has been to its goal
+        stalled = []  # the stalled agents, in the order they stalled
+        steps, half = 0, max(1, self.window // 2)
+        while steps < max_steps and any(p != goal for p, (_, goal, _) in zip(positions, agents)):
+            window = self.plan([(p, goal, size) for p, (_, goal, size) in zip(positions, agents)],
+                               stalled)
+            for step in range(half):
+                for agent, path in enumerate(window):
+                    action = path[step] if step < len(path) else WAIT
+                    paths[agent].append(action)
+                    positions[agent] = (positions[agent][0] + action[0],
+                                        positions[agent][1] + action[1])
+            steps += half
+            for agent, (start, goal, size) in enumerate(agents):
+                cell = self.grid.cell_of(positions[agent])
+                cost = self.costs(self.grid.cell_of(goal), size)[cell]
+                if positions[agent] == goal:
+                    if agent in stalled:
+                        stalled.remove(agent)
+                elif cost < best[agent]:
+                    best[agent] = cost
+                elif agent not in stalled:
+                    stalled.append(agent)
+        # nobody needs the trailing waits of agents that got to their goals early
+        for path in paths:
+            while path and path[-1] == WAIT:
+                path.pop()
+        return paths, [p == goal for p, (_, goal, _) in zip(positions, agents)]
@@ -0,0 +1,123 @@
+import heapq
+import struct  # packs the headers of the first-move table files
+import sys
+from array import array
+from bisect import bisect_right
+
+from settings import *  # use a separate file for all the constant settings
+
+
+# compressed path database of first moves for one object size on a Grid
+# row s holds, for every target tile in s's sector, the index into LEGAL_ACTIONS of the first
+# action of an optimal path from s. targets are listed in cell id order and each row is run-length
+# compressed, with targets outside the sector treated as wildcards that extend the current run.
+# following the first moves from start to goal walks an optimal path without any search
+class FirstMoveTable:
+    def __init__(self, width, height, size, offsets, starts, moves):
+        self.width = width
+        self.height = height
+        self.size = size
+        self.offsets = offsets  # row s is runs offsets[s] to offsets[s + 1] - 1
+        self.starts = starts  # starts[run] = first target cell id of the run
+        self.moves = moves  # moves[run] = LEGAL_ACTIONS index of the run's first move
+
+    # build the table by running a Dijkstra search from every tile, which takes a while on all
+    # but the smallest maps, so it is meant to be run offline (see the bottom of this file)
+    @classmethod
+    def build(cls, grid, size):
+        width, height = grid.width(), grid.height()
+        labels = grid.sectors(size)
+        cells = width * height
+        # the legal (neighbour, action index, cost) moves out of every cell, worked out once
+        moves_from = [[] for _ in range(cells)]
+        sector_cells = {}
+        for cell in range(cells):
+            if labels[cell] == 0:
+                continue
+            sector_cells.setdefault(labels[cell], []).append(cell)
+            tile = grid.tile_of(cell)
+            for i, action in enumerate(LEGAL_ACTIONS):
+                if grid.is_legal_action(tile, action, size):
+                    moves_from[cell].append((grid.cell_of((tile[0] + action[0],
+                                                           tile[1] + action[1])), i,
+                                             CARDINAL_COST if 0 in action else DIAGONAL_COST))
+
+        offsets, starts, moves = array('I', [0]), array('I'), array('B')
+        for source in range(cells):
+            if labels[source] != 0:
+                first = cls.__first_moves(source, moves_from, cells)
+                run_move = None
+                for target in sector_cells[labels[source]]:
+                    move = first[target]
+                    if move != run_move and move >= 0:
+                        # the first run starts at cell 0 so every lookup lands inside the row
+                        starts.append(target if run_move is not None else 0)
+                        moves.append(move)
+                        run_move = move
+            offsets.append(len(starts))
+        return cls(width, height, size, offsets, starts, moves)
+
+    # Dijkstra search from source that records the first move of the best path to every tile
+    @staticmethod
+    def __first_moves(source, moves_from, cells):
+        dist, first = array('i', [-1]) * cells, array('b', [-1]) * cells
+        dist[source] = 0
+        open_list = [(0, source)]
+        while open_list:
+            d, cell = heapq.heappop(open_list)
+            if d > dist[cell]:
+                continue
+            for neighbour, move, cost in moves_from[cell]:
+                nd = d + cost
+                if dist[neighbour] < 0 or nd < dist[neighbour]:
+                    dist[neighbour] = nd
+                    first[neighbour] = move if cell == source else first[cell]
+                    heapq.heappush(open_list, (nd, neighbour))
+        return first
+
+    # returns the LEGAL_ACTIONS index of the first move from source towards target, both of
+    # which must be cell ids in the same sector, or -1 if source has no row
+    def first_move(self, source, target):
+        lo, hi = self.offsets[source], self.offsets[source + 1]
+        if lo == hi:
+            return -1
+        return self.moves[bisect_right(self.starts, target, lo, hi) - 1]
+
+    # returns the actions of an optimal path from start to goal, which must be connected
+    def path(self, start, goal):
+        width, path = self.width, []
+        cell, target = start[1] * width + start[0], goal[1] * width + goal[0]
+        while cell != target:
+            action = LEGAL_ACTIONS[self.first_move(cell, target)]
+            path.append(action)
+            cell += action[1] * width + action[0]
+        return path
+
+    def write(self, f):
+        f.write(struct.pack('<IIII', self.size, len(self.offsets), len(self.starts),
+                            len(self.moves)))
+        self.offsets.tofile(f)
+        self.starts.tofile(f)
+        self.moves.tofile(f)
+
+    @classmethod
+    def read(cls, f, width, height):
+        size, offset_count, start_count, move_count = struct.unpack('<IIII', f.read(16))
+        offsets, starts, moves = array('I'), array('I'), array('B')
+        offsets.fromfile(f, offset_count)
+        starts.fromfile(f, start_count)
+        moves.fromfile(f, move_count)
+        return cls(width, height, size, offsets, starts, moves)
+
+
+# offline builder: python cpd.py <map file> [sizes...]
+# builds the first-move tables and saves them next to the map for Grid.load_first_moves
+if __name__ == '__main__':
+    import grid_student
+
+    grid = grid_student.Grid(sys.argv[1])
+    sizes = [int(size) for size in sys.argv[2:]] or None
+    grid.build_first_moves(sizes)
+    grid.save_first_moves()
+    print("saved", grid.filename + FIRST_MOVE_EXTENSION, "runs per size:",
+          dict((size, len(table.starts)) for size, table in grid.first_moves.items()))
@@ -0,0 +1,166 @@
+import heapq
+
+from settings import *  # use a separate file for all the constant settings
+from grid_student import ExpandedSet
+
+INFINITY = float('inf')
+
+
+# D* Lite planner that keeps its search between calls, for an object of one size walking to a
+# fixed goal on a Grid that may change under it
+# the search runs backwards from the goal, g[cell] is the cost from cell to the goal and rhs[cell]
+# the one-step lookahead of it. when the object moves or tiles are edited only the cells whose
+# costs are affected become inconsistent and get expanded again, instead of searching from scratch
+# the heuristic is the octile distance to the current start, and km adds up how far the start has
+# moved so the keys already on the open list stay valid lower bounds
+class DStarLite:
+    def __init__(self, grid, start, goal, size):
+        self.grid = grid
+        self.size = size
+        self.width, self.height = grid.width(), grid.height()
+        self.start = grid.cell_of(start)
+        self.goal = grid.cell_of(goal)
+        self.expanded = ExpandedSet(self.width, self.height)  # cells expanded by the last plan
+        self.__reset()
+
+    # forget the whole search and start again from the goal
+    def __reset(self):
+        cells = self.width * self.height
+        self.g = [INFINITY] * cells
+        self.rhs = [INFINITY] * cells
+        self.rhs[self.goal] = 0
+        self.km = 0
+        self.last = self.start  # the start the keys were last computed for
+        self.version = self.grid.version()  # the map version the search is up to date with
+        # open list of (key, cell) entries, queued[cell] is the current key of each queued cell
+        # and entries with any other key are stale and skipped
+        self.open_list = []
+        self.queued = {}
+        self.__push(self.goal)
+
+    def __heuristic(self, cell):
+        width = self.width
+        dx = abs(cell % width - self.start % width)
+        dy = abs(cell // width - self.start // width)
+        if dx > dy:
+            return DIAGONAL_COST * dy + CARDINAL_COST * (dx - dy)
+        return DIAGONAL_COST * dx + CARDINAL_COST * (dy - dx)
+
+    def __key(self, cell):
+        best = min(self.g[cell], self.rhs[cell])
+        return best + self.__heuristic(cell) + self.km, best
+
+    def __push(self, cell):
+        key = self.__key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.open_list, (key, cell))
+
+    # returns the smallest key on the open list, dropping the stale entries on top of it
+    def __top_key(self):
+        open_list, queued = self.open_list, self.queued
+        while open_list:
+            key, cell = open_list[0]
+            if queued.get(cell) == key:
+                return key
+            heapq.heappop(open_list)
+        return INFINITY, INFINITY
+
+    # yields the (cell, cost) of every move the object can make out of a cell
+    # is_legal_action only looks at the tiles a move enters and cuts past, so an object standing on
+    # a tile it no longer fits on after an edit has to be ruled out here
+    def successors(self, cell):
+        tile = (cell % self.width, cell // self.width)
+        if self.grid.clearance(tile) < self.size:
+            return
+        for action in LEGAL_ACTIONS:
+            if self.grid.is_legal_action(tile, action, self.size):
+                yield cell + action[1] * self.width + action[0], \
+                      DIAGONAL_COST if action[0] and action[1] else CARDINAL_COST
+
+    # yields the (cell, cost) of every move the object can make into a cell
+    def predecessors(self, cell):
+        x, y = cell % self.width, cell // self.width
+        for action in LEGAL_ACTIONS:
+            px, py = x - action[0], y - action[1]
+            if 0 <= px < self.width and 0 <= py < self.height and \
+                    self.grid.clearance((px, py)) >= self.size and \
+                    self.grid.is_legal_action((px, py), action, self.size):
+                yield py * self.width + px, \
+                      DIAGONAL_COST if action[0] and action[1] else CARDINAL_COST
+
+    # recompute the lookahead of a cell and queue it if that makes it inconsistent
+    def __update(self, cell):
+        if cell != self.goal:
+            g = self.g
+            self.rhs[cell] = min([cost + g[s] for s, cost in self.successors(cell)] or [INFINITY])
+        self.queued.pop(cell, None)
+        if self.g[cell] != self.rhs[cell]:
+            self.__push(cell)
+
+    # expand inconsistent cells until the start's cost is known to be optimal
+    def __compute(self):
+        g, rhs, queued = self.g, self.rhs, self.queued
+        while self.__top_key() < self.__key(self.start) or rhs[self.start] != g[self.start]:
+            old_key, cell = heapq.heappop(self.open_list)
+            del queued[cell]
+            new_key = self.__key(cell)
+            if old_key < new_key:
+                self.__push(cell)
+                continue
+            self.expanded.add_cell(cell)
+            if g[cell] > rhs[cell]:
+                g[cell] = rhs[cell]
+                for p, cost in self.predecessors(cell):
+                    self.__update(p)
+            else:
+                g[cell] = INFINITY
+                self.__update(cell)
+                for p, cost in self.predecessors(cell):
+                    self.__update(p)
+
+    # tell the planner the object now stands on tile, usually the next tile along its path
+    def move_to(self, tile):
+        self.start = self.grid.cell_of(tile)
+
+    # bring the search up to date with the current start and any tiles edited since the last
+    # plan, and return the (actions, cost) of an optimal path from the start to the goal, or
+    # ([], 0) if there isn't one
+    def plan(self):
+        self.expanded = ExpandedSet(self.width, self.height)
+        edits = self.grid.edits_since(self.version)
+        if edits is None:
+            self.__reset()
+            edits = []
+        if self.last != self.start:
+            self.km += self.__heuristic(self.last)
+            self.last = self.start
+        self.version = self.grid.version()
+        for cell in self.__affected(edits):
+            self.__update(cell)
+        self.__compute()
+        return self.path()
+
+    # returns the cells whose outgoing moves may have changed with the edited tiles: an object
+    # only starts or stops fitting on the tiles whose size x size square covers an edited tile,
+    # and a move depends on the tiles it enters and cuts past, which are all next to its source
+    def __affected(self, edits):
+        size, cells = self.size, set()
+        for x, y in edits:
+            for ny in range(max(0, y - size), min(self.height, y + 2)):
+                for nx in range(max(0, x - size), min(self.width, x + 2)):
+                    cells.add(ny * self.width + nx)
+        return cells
+
+    # returns the (actions, cost) of the path found by stepping greedily along the g-costs
+    def path(self):
+        g, width = self.g, self.width
+        cell, goal = self.start, self.goal
+        if g[cell] == INFINITY:
+            return [], 0
+        actions, cost = [], 0
+        while cell != goal:
+            step, step_cost = min(self.successors(cell), key=lambda move: move[1] + g[move[0]])
+            actions.append(((step % width) - (cell % width), (step // width) - (cell // width)))
+            cost += step_cost
+            cell = step
+        return actions, cost
@@ -1,90 +1,246 @@
 import heapq
+import mmap  # the grid cache is mapped straight into memory instead of being read
+import os  # used to size the batch query process pool
+import time  # wall-clock budgets of the anytime search
+import struct  # packs the headers of the landmark, first-move, map and cache files
+import zlib  # checksums the map a landmark or cache file was built for
+from array import array  # compact flat storage for the tile and sector data
+from collections import OrderedDict, deque  # LRU path cache and the bounded map edit log
+from multiprocessing import Pool, RawArray  # batch queries run in workers sharing the map memory
 
 from settings import *  # use a separate file for all the constant settings
+from cpd import FirstMoveTable  # compressed first-move database used by the 'cpd' method
+from hpa import ClusterGraph  # hierarchical abstraction used by the 'hpa' search method
+
+try:
+    import numpy as np  # optional, zero-copy views of the flat storage and vectorized flow fields
+except ImportError:
+    np = None
+
+# translation table that turns the digit characters of a map file directly into tile values
+TILE_DIGITS = bytes.maketrans(b'0123456789', bytes(range(10)))
 
 
 # the class we will use to store the map, and make calls to path finding
 class Grid:
     # set up all the default values for the frid and read in the map from a given file
+    # the map may be a text file of digits or a binary map written by save_map. everything
+    # derived from it is cached next to it, keyed by a checksum of the map file, so loading the
+    # same map again only maps the cache into memory instead of parsing and labeling the map
     def __init__(self, filename):
-        # 2D list that will hold all of the grid tile information 
-        self.__grid = []
-        self.__load_data(filename)
-        self.__width, self.__height = len(self.__grid), len(self.__grid[0])
+        # flat array of tile types, indexed by cell id (see cell_of / tile_of)
+        # the tiles, clearance and sector labels are memoryviews, whether they were mapped from the
+        # cache or built from the map file, so they behave the same either way
+        self.__tiles = memoryview(array('B'))
+        self.__width, self.__height = 0, 0
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            data = f.read()
+        source = zlib.crc32(data) & 0xffffffff
+        if not self.__load_cache(filename + GRID_CACHE_EXTENSION, source):
+            self.__load_data(data)
+            # clearance[cell] = side of the largest same-type square with its top left corner on
+            # cell
+            self.__clearance = self.__compute_clearance()
 
-        # flood fill algorithm to create connectivity/sector map
-        def flood_fill(grid, start, label, size):
-            start_type = self.get(start)
+            # generate the connectivity/sector map for each object size
+            #  format is sector_grid[size - 1][cell id], label 0 means the object does not fit there
+            self.sector_grid = [self.__label_sectors(size) for size in range(1, MAX_SIZE + 1)]
+            self.__save_cache(filename + GRID_CACHE_EXTENSION, source)
+        self.__init_state()
 
-            # initialize queue with starting tile
-            # queue is a set to avoid unnecessarily adding
-            # length with duplicate tiles before they're visited
-            queue = {start}
-            visited = []
+    # builds a Grid around existing flat tile, clearance and sector label arrays without copying
+    # them, this is how the batch query workers read a map that lives in shared memory
+    # landmarks and jump_tables hand over ALT landmarks and JPS+ jump tables already built for it,
+    # in the same form as Grid.landmarks and the tables __jump_table builds
+    @classmethod
+    def from_arrays(cls, width, height, tiles, clearance, sector_grid, landmarks=None,
+                    jump_tables=None):
+        grid = cls.__new__(cls)
+        grid.filename = None
+        grid.__width, grid.__height = width, height
+        grid.__tiles, grid.__clearance = tiles, clearance
+        grid.sector_grid = list(sector_grid)
+        grid.__init_state()
+        grid.landmarks.update(landmarks or {})
+        grid.__jump_tables.update(jump_tables or {})
+        return grid
 
-            while queue:
-                node = queue.pop()
+    # set up the caches and bookkeeping that are derived from the map data
+    def __init_state(self):
+        # JPS+ jump distance tables and HPA* cluster graphs per object size, built when needed
+        self.__jump_tables = {}
+        self.__cluster_graphs = {}
+        # the map version goes up every time the map changes, so cached results can tell if
+        # they are stale
+        self.__version = 0
+        # the tiles changed by the most recent edits, the last one took the map to __version
+        self.__edits = deque(maxlen=EDIT_LOG_SIZE)
+        self.path_cache = PathCache()
+        # next unused sector label of each layer, found the first time the layer is edited
+        self.__next_labels = {}
+        # ALT landmarks per object size, landmarks[size] = list of (landmark tile, distance array)
+        self.landmarks = {}
+        # compressed first-move tables per object size, first_moves[size] = FirstMoveTable
+        self.first_moves = {}
+        # the distance fields of the most recently asked for (goal, size) pairs
+        self.__fields = OrderedDict()
+        self.__fields_version = 0
+        # the reachability masks of the most recently asked for (label, size) pairs
+        self.__masks = OrderedDict()
+        self.__masks_version = 0
+        # the flow fields of the most recently asked for (goal, size) pairs
+        self.__flows = OrderedDict()
+        self.__flows_version = 0
+        # worker pool for get_paths, its size and the map version its shared memory came from
+        self.__pool = None
+        self.__pool_size = 0
+        self.__pool_version = -1
+        self.__pool_tables = None
+        # flat per-cell arrays reused by every AStar search, made on the first search
+        self.__search_space = None
 
-                if node not in visited:
-                    visited.append(node)
+    # loads the grid data from the contents of a map file
+    def __load_data(self, data):
+        if data[:4] == b'MAP1':
+            self.__width, self.__height = struct.unpack('<II', data[4:12])
+            self.__tiles = memoryview(array('B', data[12:12 + self.__width * self.__height]))
+            return
+        # each line in the map file is one row of digits, so the rows can be concatenated
+        # straight into the row-major flat tile array without building any per-tile objects
+        rows = [line.strip() for line in data.splitlines()]
+        rows = [row for row in rows if row]
+        self.__width, self.__height = len(rows[0]), len(rows)
+        self.__tiles = memoryview(array('B', b''.join(rows).translate(TILE_DIGITS)))
 
-                    x = node[0]
-                    y = node[1]
-                    node_type = self.get(node)
+    # save the map in the binary map format, by default in the map file name + '.bmap'
+    # a binary map is a header and then one byte per tile, row by row, and loads without parsing
+    def save_map(self, filename=None):
+        with open(filename or self.filename + MAP_EXTENSION, 'wb') as f:
+            f.write(struct.pack('<4sII', b'MAP1', self.__width, self.__height))
+            f.write(self.__tiles)
 
-                    # if currently checked tile different type than first then do nothing
-                    if node_type != start_type:
-                        continue
+    # map the cache written by __save_cache into memory and use its arrays in place, if it was
+    # built from a map file with the given checksum and for the current MAX_SIZE
+    # the mapping is copy-on-write, so set() can still edit the map without touching the file
+    # returns false if there is no usable cache
+    def __load_cache(self, filename, source):
+        try:
+            with open(filename, 'rb') as f:
+                magic, width, height, checksum, layers = struct.unpack('<4sIIII', f.read(20))
+                if magic != b'GRC1' or checksum != source or layers != MAX_SIZE:
+                    return False
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError, struct.error):
+            return False
+        cells = width * height
+        labels = 20 + 2 * cells + (-(20 + 2 * cells) % 4)  # the label layers are 4-byte aligned
+        if len(data) != labels + 4 * cells * layers:
+            return False
+        view = memoryview(data)
+        self.__width, self.__height = width, height
+        self.__tiles = view[20:20 + cells]
+        self.__clearance = view[20 + cells:20 + 2 * cells]
+        self.sector_grid = [view[labels + 4 * cells * i:labels + 4 * cells * (i + 1)].cast('I')
+                            for i in range(layers)]
+        return True
 
-                    # check type of each tile in the object itself, starting from top left
-                    # corner (x,y). if any tile is different then abandon the search
-                    # FIXME: why doesn't this work?
-                    try:
-                        for xx in range(size):
-                            for yy in range(size):
-                                if (x + xx) < self.width() and \
-                                                (y + yy) < self.height():
-                                    check_type = self.get((x + xx, y + yy))
-                                    # make sure all tiles inside the object are same type
-                                    assert check_type == node_type
-                    except AssertionError:
-                        continue
+    # write the tiles, clearance and sector labels next to the map for __load_cache
+    # the arrays are stored in native byte order, like the landmark and first-move files
+    # the file is written under a temporary name first so no other process sees half of it, and
+    # a map directory that can't be written to just means the map is labeled on every load
+    def __save_cache(self, filename, source):
+        temporary = '%s.%d' % (filename, os.getpid())
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(struct.pack('<4sIIII', b'GRC1', self.__width, self.__height, source,
+                                    len(self.sector_grid)))
+                f.write(self.__tiles)
+                f.write(self.__clearance)
+                f.write(bytes(-(20 + 2 * len(self.__tiles)) % 4))
+                for labels in self.sector_grid:
+                    f.write(labels)
+            os.replace(temporary, filename)
+        except OSError:
+            pass
+
+    # computes the clearance map in one dynamic programming pass from the bottom right corner
+    # a tile's square can only grow past 1 if its right, lower and diagonal neighbours have the
+    # same type, in which case it is one larger than the smallest of their three squares
+    # values are capped at 255 so that the map fits in a byte array
+    def __compute_clearance(self):
+        width, height, tiles = self.__width, self.__height, self.__tiles
+        clearance = array('B', bytes(width * height))
+        for y in range(height - 1, -1, -1):
+            row = y * width
+            clearance[row + width - 1] = 1
+            if y == height - 1:
+                clearance[row:row + width] = array('B', [1]) * width
+                continue
+            for cell in range(row + width - 2, row - 1, -1):
+                tile_type = tiles[cell]
+                below = cell + width
+                if tiles[cell + 1] == tile_type and tiles[below] == tile_type and \
+                        tiles[below + 1] == tile_type:
+                    clearance[cell] = min(clearance[cell + 1], clearance[below],
+                                          clearance[below + 1], 254) + 1
+                else:
+                    clearance[cell] = 1
+        return memoryview(clearance)
+
+    # two-pass connected component labeling of the tiles an object of the given size fits on
+    # the first pass splits each row into runs of same-type tiles and unions every run with the
+    # overlapping runs of the row above, the second pass writes out the compacted root labels
+    # every tile is touched a constant number of times, so one layer costs O(width * height)
+    def __label_sectors(self, size):
+        width, height = self.__width, self.__height
+        tiles, clearance = self.__tiles, self.__clearance
+        parent = [0]  # union-find forest over provisional run labels, 0 is never used
+        runs = []  # (start cell, end cell, provisional label) for every run in the map
+
+        def find(label):
+            while parent[label] != label:
+                parent[label] = parent[parent[label]]
+                label = parent[label]
+            return label
+
+        above = []  # runs of the previous row as (start x, end x, tile type, label)
+        for y in range(height):
+            row, current, x = y * width, [], 0
+            while x < width:
+                if clearance[row + x] < size:
+                    x += 1
+                    continue
+                start, tile_type, label = x, tiles[row + x], len(parent)
+                while x < width and tiles[row + x] == tile_type and clearance[row + x] >= size:
+                    x += 1
+                parent.append(label)
+                current.append((start, x, tile_type, label))
+                runs.append((row + start, row + x, label))
+
+            # runs are sorted by x, so the overlapping pairs can be found with two pointers
+            i = j = 0
+            while i < len(above) and j < len(current):
+                a, b = above[i], current[j]
+                if a[0] < b[1] and b[0] < a[1] and a[2] == b[2]:
+                    ra, rb = find(a[3]), find(b[3])
+                    if ra != rb:
+                        parent[max(ra, rb)] = min(ra, rb)
+                if a[1] < b[1]:
+                    i += 1
+                else:
+                    j += 1
+            above = current
 
-                    # assign label to tile if it's unvisited (0)
-                    if grid[x][y] == 0:
-                        grid[x][y] = label
-                        # add surrounding 4 spaces (up, down, left, right) to search queue
-                        if x > 0:
-                            queue.add((x - 1, y))
-                        if x < len(grid[y]) - 1:
-                            queue.add((x + 1, y))
-                        if y > 0:
-                            queue.add((x, y - 1))
-                        if y < len(grid) - 1:
-                            queue.add((x, y + 1))
-
-            return grid
-
-        # generate 2D grids initialized to 0s for each object size
-        #  format of 3D grid is [size][x][y]
-        self.sector_grid = [[[0] * self.width() for _ in range(self.height())] for _ in range(
-            MAX_SIZE)]
-
-        # call flood fill on each 2D grid, starting at first 0-labelled tile
-        for i in range(MAX_SIZE):
-            c = 1
-            for j, row in enumerate(self.sector_grid[i]):
-                for k, tile in enumerate(row):
-                    if tile == 0:
-                        self.sector_grid[i] = flood_fill(self.sector_grid[i], (j, k), c, i + 1)
-                        c += 1
-
-    # loads the grid data from a given file name
-    def __load_data(self, filename):
-        # turn each line in the map file into a list of integers
-        temp_grid = [list(map(int, line.strip())) for line in open(filename, 'r')]
-        # transpose the input since we read it in as (y, x) 
-        self.__grid = [list(i) for i in zip(*temp_grid)]
+        # resolve every run to its root and number the roots 1, 2, 3, ... in scan order
+        labels = array('I', bytes(4 * width * height))
+        final = {}
+        for start, end, label in runs:
+            root = find(label)
+            if root not in final:
+                final[root] = len(final) + 1
+            labels[start:end] = array('I', [final[root]]) * (end - start)
+        return memoryview(labels)
 
     # return the cost of a given action
     # note: this only works for actions in our LEGAL_ACTIONS defined set (8 directions)
@@ -94,36 +250,631 @@ class Grid:
         # returns the tile type of a given position
 
     def get(self, tile):
-        return self.__grid[tile[0]][tile[1]]
+        return self.__tiles[tile[1] * self.__width + tile[0]]
 
     def width(self):
         return self.__width
 
+    def version(self):
+        return self.__version
+
+    # returns the tiles edited since the map was at the given version, oldest first, or None if
+    # the edit log no longer goes back that far and the caller has to start over
+    def edits_since(self, version):
+        count = self.__version - version
+        if count > len(self.__edits):
+            return None
+        return list(self.__edits)[len(self.__edits) - count:]
+
+    # returns a checksum of the tiles, used to check that saved tables belong to this map
+    def checksum(self):
+        return zlib.crc32(memoryview(self.__tiles).cast('B')) & 0xffffffff
+
     def height(self):
         return self.__height
 
+    # returns the integer cell id of a given tile, cells are stored row by row
+    def cell_of(self, tile):
+        return tile[1] * self.__width + tile[0]
+
+    # returns the (x, y) tile of a given cell id
+    def tile_of(self, cell):
+        return cell % self.__width, cell // self.__width
+
+    # returns the SearchSpace that AStar keeps its per-cell state in, one search at a time
+    def search_space(self):
+        if self.__search_space is None:
+            self.__search_space = SearchSpace(self.__width * self.__height)
+        return self.__search_space
+
+    # returns the flat tile array as a 'B' memoryview indexed by cell id, or a zero-copy
+    # (height, width) NumPy view of it if requested. either way it shares the Grid's memory, so
+    # edit the map through set(), which keeps the clearance and sector layers up to date
+    def tile_array(self, numpy=False):
+        if not numpy:
+            return self.__tiles
+        if np is None:
+            raise ImportError("NumPy is required for numpy=True")
+        return np.frombuffer(self.__tiles, dtype=np.uint8).reshape(self.__height, self.__width)
+
+    # returns the side of the largest square object that fits with its top left corner on tile
+    def clearance(self, tile):
+        return self.__clearance[tile[1] * self.__width + tile[0]]
+
+    # change the type of a single tile, keeping the clearance map and every sector layer up to date
+    # without relabeling the map: only the tiles whose clearance or labels can change are touched
+    def set(self, tile, tile_type):
+        cell = self.cell_of(tile)
+        if self.__tiles[cell] == tile_type:
+            return
+        self.__tiles[cell] = tile_type
+        self.__update_clearance(tile)
+
+        # an object of size n only stops or starts fitting on the tiles whose n x n square covers
+        # the edited tile, so each layer only has to look at that window
+        for size, labels in enumerate(self.sector_grid, 1):
+            window = [y * self.__width + x
+                      for y in range(max(0, tile[1] - size + 1), tile[1] + 1)
+                      for x in range(max(0, tile[0] - size + 1), tile[0] + 1)]
+            removed = [c for c in window
+                       if labels[c] != 0 and (c == cell or self.__clearance[c] < size)]
+            added = [c for c in window
+                     if self.__clearance[c] >= size and (c == cell or labels[c] == 0)]
+            if removed:
+                self.__remove_from_sectors(labels, size, removed)
+            for c in added:
+                self.__add_to_sectors(labels, size, c)
+
+        # everything derived from the old map is now stale
+        self.__version += 1
+        self.__edits.append(tile)
+        self.__jump_tables.clear()
+        self.__cluster_graphs.clear()
+        # landmark distances and first moves computed for the old map can be wrong now
+        self.landmarks.clear()
+        self.first_moves.clear()
+
+    # recompute the clearance of the tiles above and to the left of an edited tile, whose squares
+    # may cover it. the tiles are visited in rings of growing distance, each ring in an order that
+    # respects the dynamic programming dependencies, until a whole ring comes out unchanged
+    def __update_clearance(self, tile):
+        width, height = self.__width, self.__height
+        tiles, clearance = self.__tiles, self.__clearance
+        tx, ty = tile
+        for d in range(max(tx, ty) + 1):
+            ring = [(tx - d, y) for y in range(ty, ty - d, -1)] + \
+                   [(x, ty - d) for x in range(tx, tx - d, -1)] + [(tx - d, ty - d)]
+            changed = False
+            for x, y in ring:
+                if x < 0 or y < 0:
+                    continue
+                cell = y * width + x
+                tile_type, below = tiles[cell], cell + width
+                if x == width - 1 or y == height - 1:
+                    value = 1
+                elif tiles[cell + 1] == tile_type and tiles[below] == tile_type and \
+                        tiles[below + 1] == tile_type:
+                    value = min(clearance[cell + 1], clearance[below], clearance[below + 1],
+                                254) + 1
+                else:
+                    value = 1
+                if clearance[cell] != value:
+                    clearance[cell] = value
+                    changed = True
+            # the first ring around the edited tile compares types with it, so it is always done
+            if not changed and d > 0:
+                break
+
+    # returns a fresh label for the given layer
+    def __new_label(self, labels, size):
+        if size not in self.__next_labels:
+            self.__next_labels[size] = max(labels) + 1
+        self.__next_labels[size] += 1
+        return self.__next_labels[size] - 1
+
+    # returns the cells next to a cell (up, down, left, right) that carry the given label
+    def __neighbours_with(self, labels, cell, label):
+        x, width = cell % self.__width, self.__width
+        if cell >= width and labels[cell - width] == label:
+            yield cell - width
+        if cell + width < len(labels) and labels[cell + width] == label:
+            yield cell + width
+        if x > 0 and labels[cell - 1] == label:
+            yield cell - 1
+        if x < width - 1 and labels[cell + 1] == label:
+            yield cell + 1
+
+    # flood fill from several seed cells in lockstep, one cell per fill per round, each fill over
+    # the label of its own seed. fills that run into each other are merged, and the cell lists of
+    # the fills that run out of cells are returned as soon as at most one fill is still going, so
+    # the work done is proportional to the size of the components that were found
+    # the seed cells must all be different
+    def __race(self, labels, seeds):
+        owner = dict((seed, i) for i, seed in enumerate(seeds))  # the fill that reached a cell
+        merged = list(range(len(seeds)))  # union-find over the fills
+        fills = [[[seed], [seed]] for seed in seeds]  # fills[i] = [frontier, cells] of fill i
+
+        def find(i):
+            while merged[i] != i:
+                merged[i] = merged[merged[i]]
+                i = merged[i]
+            return i
+
+        active = list(range(len(seeds)))
+        finished = []
+        while len(active) > 1:
+            for i in list(active):
+                if find(i) != i:
+                    continue
+                frontier, cells = fills[i]
+                if not frontier:
+                    finished.append(cells)
+                    active.remove(i)
+                    continue
+                cell = frontier.pop()
+                for neighbour in self.__neighbours_with(labels, cell, labels[cell]):
+                    if neighbour not in owner:
+                        owner[neighbour] = i
+                        frontier.append(neighbour)
+                        cells.append(neighbour)
+                        continue
+                    other = find(owner[neighbour])
+                    if other != i:
+                        # the two fills are in the same component, continue them as one
+                        merged[other] = i
+                        frontier.extend(fills[other][0])
+                        cells.extend(fills[other][1])
+                        fills[other] = None
+                        active.remove(other)
+            active = [i for i in active if find(i) == i]
+        return finished
+
+    # take cells out of their sectors, giving fresh labels to any pieces that got cut off
+    def __remove_from_sectors(self, labels, size, cells):
+        seeds = {}  # seeds[label] = the remaining cells next to a removed cell with that label
+        for cell in cells:
+            seeds.setdefault(labels[cell], [])
+            labels[cell] = 0
+        for cell in cells:
+            for label in seeds:
+                seeds[label].extend(self.__neighbours_with(labels, cell, label))
+        for label, neighbours in seeds.items():
+            for piece in self.__race(labels, list(OrderedDict.fromkeys(neighbours))):
+                new_label = self.__new_label(labels, size)
+                for c in piece:
+                    labels[c] = new_label
+
+    # put a cell an object now fits on into a sector, merging the sectors it connects
+    def __add_to_sectors(self, labels, size, cell):
+        tile_type, tiles = self.__tiles[cell], self.__tiles
+        seeds = OrderedDict()  # one neighbour of each different sector the cell touches
+        x, width = cell % self.__width, self.__width
+        for neighbour in (cell - width, cell + width, cell - 1 if x > 0 else -1,
+                          cell + 1 if x < width - 1 else -1):
+            if 0 <= neighbour < len(labels) and labels[neighbour] != 0 and \
+                    tiles[neighbour] == tile_type and labels[neighbour] not in seeds:
+                seeds[labels[neighbour]] = neighbour
+        if not seeds:
+            labels[cell] = self.__new_label(labels, size)
+            return
+        # relabel every sector but the biggest one, which the race never finishes
+        pieces = self.__race(labels, list(seeds.values()))
+        finished = set(labels[piece[0]] for piece in pieces)
+        label = next(l for l in seeds if l not in finished) if len(finished) < len(seeds) \
+            else labels[pieces[-1][0]]
+        for piece in pieces:
+            for c in piece:
+                labels[c] = label
+        labels[cell] = label
+
+    # returns the sector labels for a given object size, sizes beyond MAX_SIZE are labeled lazily
+    def sectors(self, size):
+        while len(self.sector_grid) < size:
+            self.sector_grid.append(self.__label_sectors(len(self.sector_grid) + 1))
+        return self.sector_grid[size - 1]
+
     # returns true if an object of a given size can navigate from start to goal
     def is_connected(self, start, goal, size):
-        grid = self.sector_grid[size - 1]
+        grid = self.sectors(size)
+        label = grid[self.cell_of(start)]
 
-        if grid[start[0]][start[1]] == grid[goal[0]][goal[1]]:
+        if label != 0 and label == grid[self.cell_of(goal)]:
             return True
         return False
 
-    # generate the path from the start to end tiles as calculated using the A* algorithm
-    def get_path(self, start, end, size):
+    # returns which tiles an object of a given size can navigate to from tile, as a flat bytes
+    # mask indexed by cell id, or a (height, width) NumPy bool array if requested. it's a single
+    # comparison of the sector layer against tile's label, cached per (label, size) until the
+    # map changes, and all false if tile is off the map or the object doesn't fit on it
+    # every tile of a sector gets the same mask object back while it is cached, so callers can
+    # tell that nothing changed by comparing it with the one they had
+    def reachable_mask(self, tile, size, numpy=False):
+        if numpy and np is None:
+            raise ImportError("NumPy is required for numpy=True")
+        if self.__masks_version != self.__version:
+            self.__masks.clear()
+            self.__masks_version = self.__version
+        labels = self.sectors(size)
+        inside = 0 <= tile[0] < self.__width and 0 <= tile[1] < self.__height
+        label = labels[self.cell_of(tile)] if inside else 0
+        key = (label, size, numpy)
+        if key in self.__masks:
+            self.__masks.move_to_end(key)
+            return self.__masks[key]
+        if np is not None:
+            mask = np.frombuffer(labels, dtype=np.uint32) == label if label else \
+                np.zeros(len(labels), dtype=bool)
+            mask = mask.reshape(self.__height, self.__width) if numpy else mask.tobytes()
+        else:
+            mask = bytes(l == label for l in labels) if label else bytes(len(labels))
+        self.__masks[key] = mask
+        while len(self.__masks) > MASK_CACHE_SIZE:
+            self.__masks.popitem(last=False)
+        return mask
+
+    # returns true if an object of a given size standing on tile can take the given action
+    # the destination must fit the object and have the same type, and diagonal actions may not
+    # cut corners, so both tiles beside the diagonal must be legal destinations as well
+    def is_legal_action(self, tile, action, size):
+        x, y = tile[0] + action[0], tile[1] + action[1]
+        if x < 0 or y < 0 or x >= self.__width or y >= self.__height:
+            return False
+        width, tiles, clearance = self.__width, self.__tiles, self.__clearance
+        cell, tile_type = tile[1] * width + tile[0], tiles[tile[1] * width + tile[0]]
+        for c in (y * width + x, cell + action[0], cell + action[1] * width):
+            if tiles[c] != tile_type or clearance[c] < size:
+                return False
+        return True
+
+    # precomputes the JPS+ jump distances of every tile for a given object size
+    # table[i][cell] is the number of steps in direction LEGAL_ACTIONS[i] to the next jump point,
+    # or minus the number of steps that can be taken before hitting a wall if there is none
+    def __jump_table(self, size):
+        if size in self.__jump_tables:
+            return self.__jump_tables[size]
+
+        width, height, labels = self.__width, self.__height, self.sectors(size)
+        table = [array('i', bytes(4 * width * height)) for _ in LEGAL_ACTIONS]
+        # the diagonal distances are defined in terms of the straight ones, so do those first
+        order = sorted(range(len(LEGAL_ACTIONS)), key=lambda i: 0 in LEGAL_ACTIONS[i], reverse=True)
+        label = 0  # the label of the tile being filled in, walkable tiles must share it
+
+        def walkable(x, y):
+            return 0 <= x < width and 0 <= y < height and labels[y * width + x] == label
+
+        for index in order:
+            dx, dy = LEGAL_ACTIONS[index]
+            dist = table[index]
+            straight = (table[LEGAL_ACTIONS.index((dx, 0))], table[LEGAL_ACTIONS.index((0, dy))]) \
+                if dx and dy else None
+            # visit the tiles against the direction so the next tile along the ray is done first
+            xs = range(width - 1, -1, -1) if dx > 0 else range(width)
+            for y in (range(height - 1, -1, -1) if dy > 0 else range(height)):
+                for x in xs:
+                    cell = y * width + x
+                    label = labels[cell]
+                    if label == 0:
+                        continue
+                    if not walkable(x + dx, y + dy) or \
+                            (dx and dy and not (walkable(x + dx, y) and walkable(x, y + dy))):
+                        continue
+                    step = cell + dy * width + dx
+                    if straight is None and is_forced(walkable, x + dx, y + dy, dx, dy):
+                        dist[cell] = 1
+                    elif straight is not None and (straight[0][step] > 0 or straight[1][step] > 0):
+                        dist[cell] = 1
+                    else:
+                        dist[cell] = dist[step] + 1 if dist[step] > 0 else dist[step] - 1
+
+        self.__jump_tables[size] = table
+        return table
+
+    # generate the path from the start to end tiles as calculated using the given search method
+    #  'astar' = plain A*, 'jps' = jump point search, 'jps+' = JPS with precomputed jump distances
+    #  'hpa' = hierarchical A* over CLUSTER_SIZE clusters, near-optimal but much faster on big maps
+    #  'alt' = A* with the landmark heuristic, landmarks are built on first use if not loaded
+    #  'cpd' = walk the compressed first-move table, which must be loaded or built beforehand
+    # the expanded tiles come back as an ExpandedSet bitmap, pass expanded=False to skip
+    # collecting them and get an empty one
+    def get_path(self, start, end, size, method='astar', expanded=True):
+        if method not in SEARCH_METHODS:
+            raise ValueError("unknown search method: %r" % (method,))
+
         if self.is_connected(start, end, size):
-            astar = AStar(start, end, self, size)
-            path = astar.a_star()
+            # popular routes are asked for over and over, so answer them from the cache
+            key = (start, end, size, method, expanded)
+            result = self.path_cache.get(key, self.__version)
+            if result is None:
+                result = self.__search(start, end, size, method, expanded)
+                self.path_cache.put(key, self.__version, result)
+            return result
+
+        return [], 0, ExpandedSet(self.__width, self.__height)
+
+    # returns an AnytimeAStar from start to end, whose improve() hands back the best path found
+    # within a time or expansion budget along with its suboptimality bound, and can be called
+    # again on later ticks to keep improving it
+    def anytime_search(self, start, end, size, epsilon=ANYTIME_EPSILON):
+        return AnytimeAStar(start, end, self, size, epsilon)
+
+    # returns the DistanceField holding the cost to goal from every tile of goal's sector, so that
+    # any number of objects heading to the same goal can read off their paths without searching
+    # the capacity most recently used fields are kept until the map changes, callers that go
+    # through more goals than that in turn can ask for a larger capacity
+    def distance_field(self, goal, size, capacity=FIELD_CACHE_SIZE):
+        if self.__fields_version != self.__version:
+            self.__fields.clear()
+            self.__fields_version = self.__version
+        key = (goal, size)
+        if key in self.__fields:
+            self.__fields.move_to_end(key)
+            return self.__fields[key]
+        field = DistanceField(self, goal, size)
+        self.__fields[key] = field
+        while len(self.__fields) > capacity:
+            self.__fields.popitem(last=False)
+        return field
+
+    # returns the FlowField of best actions towards goal for every tile of goal's sector, so that
+    # crowds heading to the same goal steer with one lookup per unit per tick
+    # the FLOW_CACHE_SIZE most recently used fields are kept until the map changes
+    def flow_field(self, goal, size):
+        if self.__flows_version != self.__version:
+            self.__flows.clear()
+            self.__flows_version = self.__version
+        key = (goal, size)
+        if key in self.__flows:
+            self.__flows.move_to_end(key)
+            return self.__flows[key]
+        flow = FlowField(self, goal, size)
+        self.__flows[key] = flow
+        while len(self.__flows) > FLOW_CACHE_SIZE:
+            self.__flows.popitem(last=False)
+        return flow
+
+    # answer a whole batch of (start, end, size) queries, returning their (path, cost, expanded)
+    # results in the same order. disconnected pairs and cached routes are answered right away, the
+    # rest are grouped by size and sector and fanned out to a pool of worker processes that read
+    # the map from shared memory, so the grid is copied to them once instead of pickled per query
+    def get_paths(self, queries, method='astar', processes=None, expanded=True):
+        if method not in SEARCH_METHODS:
+            raise ValueError("unknown search method: %r" % (method,))
+
+        results = [None] * len(queries)
+        pending = {}  # pending[(start, end, size)] = indices of the queries asking for it
+        for i, (start, end, size) in enumerate(queries):
+            if not self.is_connected(start, end, size):
+                results[i] = [], 0, ExpandedSet(self.__width, self.__height)
+                continue
+            result = self.path_cache.get((start, end, size, method, expanded), self.__version)
+            if result is not None:
+                results[i] = result
+            else:
+                pending.setdefault((start, end, size), []).append(i)
+
+        # order the work by size and sector so each worker chunk stays within one layer of the
+        # grid, which keeps the worker's lazily built tables and cache lines warm
+        work = sorted(pending, key=lambda q: (q[2], self.sector_grid[q[2] - 1][self.cell_of(q[0])],
+                                              self.cell_of(q[0])))
+        processes = processes or os.cpu_count() or 1
+        # first-move table walks and cluster graph searches are cheap, and those tables are
+        # object graphs that only live in this process
+        if processes == 1 or len(work) < BATCH_PARALLEL_MIN or method in ('cpd', 'hpa'):
+            answers = [self.__search(start, end, size, method, expanded)
+                       for start, end, size in work]
+        else:
+            # build the landmarks or jump tables here, once, so the workers get them from the
+            # shared memory instead of each building its own
+            sizes = sorted(set(size for _, _, size in work))
+            if method == 'alt' and any(size not in self.landmarks for size in sizes):
+                self.build_landmarks(sizes=[size for size in sizes if size not in self.landmarks])
+            elif method == 'jps+':
+                for size in sizes:
+                    self.__jump_table(size)
+            chunk = max(1, -(-len(work) // (processes * 4)))
+            chunks = [(method, expanded, work[i:i + chunk]) for i in range(0, len(work), chunk)]
+            answers = []
+            for answer in self.__worker_pool(processes).imap(find_paths, chunks):
+                answers.extend(answer)
+
+        for query, result in zip(work, answers):
+            self.path_cache.put(query + (method, expanded), self.__version, result)
+            for i in pending[query]:
+                results[i] = result
+        return results
+
+    # returns the batch worker pool, copying the map, its landmarks and its jump tables into
+    # shared memory and starting the workers the first time, or again if the map has changed or
+    # more tables have been built since they were started
+    def __worker_pool(self, processes):
+        # which landmarks and jump tables the shared memory holds, the landmark tiles are enough
+        # to tell landmark sets apart since their distance arrays follow from the map
+        tables = ([(size, [tile for tile, _ in landmarks])
+                   for size, landmarks in sorted(self.landmarks.items())],
+                  sorted(self.__jump_tables))
+        if self.__pool is not None and self.__pool_version == self.__version and \
+                self.__pool_size == processes and self.__pool_tables == tables:
+            return self.__pool
+        self.close()
+        arrays = [self.__tiles, self.__clearance] + self.sector_grid
+        for _, landmarks in sorted(self.landmarks.items()):
+            arrays.extend(costs for _, costs in landmarks)
+        for size in tables[1]:
+            arrays.extend(self.__jump_tables[size])
+        shared = RawArray('B', sum(len(a) * memoryview(a).itemsize for a in arrays))
+        view, offset = memoryview(shared).cast('B'), 0
+        for a in arrays:
+            a = memoryview(a).cast('B')
+            view[offset:offset + len(a)] = a
+            offset += len(a)
+        layout = (self.__width, self.__height, [memoryview(a).format for a in arrays], tables)
+        self.__pool = Pool(processes, initializer=init_worker, initargs=(shared, layout))
+        self.__pool_version, self.__pool_size = self.__version, processes
+        self.__pool_tables = tables
+        return self.__pool
+
+    # shut down the batch worker pool, if there is one
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool.join()
+            self.__pool = None
+
+    # pick landmarks for each object size and store the distance from every tile to each of them
+    # landmarks go to the largest sectors first, then to the tile farthest from the landmarks
+    # already in its sector, which is where the triangle inequality bounds are most informative
+    def build_landmarks(self, count=LANDMARK_COUNT, sizes=None):
+        for size in sizes or range(1, len(self.sector_grid) + 1):
+            labels = self.sectors(size)
+            sector_sizes = {}
+            for label in labels:
+                sector_sizes[label] = sector_sizes.get(label, 0) + 1
+            sector_sizes.pop(0, None)
+
+            landmarks = []
+            nearest = array('i', [-1]) * len(labels)  # distance to the nearest landmark so far
+            while len(landmarks) < count:
+                # a sector without landmarks is worth about as much as its tile count in steps
+                served = set(labels[self.cell_of(tile)] for tile, _ in landmarks)
+                best, best_score = None, 0
+                for label, tiles in sector_sizes.items():
+                    if label not in served and tiles * CARDINAL_COST > best_score:
+                        best, best_score = label, tiles * CARDINAL_COST
+                if best is not None:
+                    # start from any tile of the sector and take the tile farthest from it
+                    anywhere = self.tile_of(next(c for c, l in enumerate(labels) if l == best))
+                    costs = DistanceField(self, anywhere, size).costs
+                    cell = max(range(len(costs)), key=costs.__getitem__)
+                else:
+                    cell = max(range(len(nearest)), key=nearest.__getitem__)
+                    best_score = nearest[cell]
+                if best_score <= 0:
+                    break
+                field = DistanceField(self, self.tile_of(cell), size)
+                landmarks.append((self.tile_of(cell), field.costs))
+                for c, d in enumerate(field.costs):
+                    if d >= 0 and (nearest[c] < 0 or d < nearest[c]):
+                        nearest[c] = d
+            self.landmarks[size] = landmarks
+
+    # returns the ALT heuristic for reaching goal with an object of the given size
+    # by the triangle inequality |d(L, n) - d(L, goal)| <= d(n, goal) for every landmark L, and
+    # taking the largest of these bounds and the octile distance stays admissible and consistent
+    # the heuristic takes a cell id, like every heuristic given to AStar
+    def landmark_heuristic(self, size, goal):
+        width = self.__width
+        tables = [(costs, costs[goal[1] * width + goal[0]]) for _, costs in
+                  self.landmarks.get(size, [])]
+        tables = [(costs, to_goal) for costs, to_goal in tables if to_goal >= 0]
+
+        def heuristic(cell):
+            dx, dy = abs(cell % width - goal[0]), abs(cell // width - goal[1])
+            h = DIAGONAL_COST * dy + CARDINAL_COST * (dx - dy) if dx > dy else \
+                DIAGONAL_COST * dx + CARDINAL_COST * (dy - dx)
+            for costs, to_goal in tables:
+                bound = abs(costs[cell] - to_goal)
+                if bound > h:
+                    h = bound
+            return h
+
+        return heuristic
+
+    # save the landmark distance tables next to the map, by default in the map file name + '.alt'
+    # the file records a checksum of the tiles so it can't be loaded for a different map
+    def save_landmarks(self, filename=None):
+        with open(filename or self.filename + LANDMARK_EXTENSION, 'wb') as f:
+            f.write(struct.pack('<4sIIII', b'ALT1', self.__width, self.__height,
+                                self.checksum(), len(self.landmarks)))
+            for size, landmarks in sorted(self.landmarks.items()):
+                f.write(struct.pack('<II', size, len(landmarks)))
+                for tile, costs in landmarks:
+                    f.write(struct.pack('<II', tile[0], tile[1]))
+                    array('i', costs).tofile(f)
+
+    # load landmark distance tables written by save_landmarks
+    def load_landmarks(self, filename=None):
+        with open(filename or self.filename + LANDMARK_EXTENSION, 'rb') as f:
+            magic, width, height, checksum, sizes = struct.unpack('<4sIIII', f.read(20))
+            if magic != b'ALT1' or (width, height) != (self.__width, self.__height) or \
+                    checksum != self.checksum():
+                raise ValueError("landmark file does not belong to this map")
+            self.landmarks = {}
+            for _ in range(sizes):
+                size, count = struct.unpack('<II', f.read(8))
+                self.landmarks[size] = []
+                for _ in range(count):
+                    tile = struct.unpack('<II', f.read(8))
+                    costs = array('i')
+                    costs.fromfile(f, width * height)
+                    self.landmarks[size].append((tile, costs))
 
-            # for some reason, combining these actions
-            # into one line massively decreases performance
-            costs = map(self.__get_action_cost, path)
-            cost_sum = sum(costs)
+    # build the compressed first-move tables for each object size, this runs a Dijkstra search
+    # from every tile so on anything but small maps it should be done offline with cpd.py
+    def build_first_moves(self, sizes=None):
+        for size in sizes or range(1, len(self.sector_grid) + 1):
+            self.first_moves[size] = FirstMoveTable.build(self, size)
 
-            return path, cost_sum, astar.closed
+    # save the first-move tables next to the map, by default in the map file name + '.cpd'
+    def save_first_moves(self, filename=None):
+        with open(filename or self.filename + FIRST_MOVE_EXTENSION, 'wb') as f:
+            f.write(struct.pack('<4sIIII', b'CPD1', self.__width, self.__height,
+                                self.checksum(), len(self.first_moves)))
+            for size, table in sorted(self.first_moves.items()):
+                table.write(f)
 
-        return [], 0, set()
+    # load first-move tables written by save_first_moves
+    def load_first_moves(self, filename=None):
+        with open(filename or self.filename + FIRST_MOVE_EXTENSION, 'rb') as f:
+            magic, width, height, checksum, sizes = struct.unpack('<4sIIII', f.read(20))
+            if magic != b'CPD1' or (width, height) != (self.__width, self.__height) or \
+                    checksum != self.checksum():
+                raise ValueError("first-move file does not belong to this map")
+            self.first_moves = {}
+            for _ in range(sizes):
+                table = FirstMoveTable.read(f, width, height)
+                self.first_moves[table.size] = table
+
+    # run the given search method from start to end and return its (path, cost, expanded)
+    def __search(self, start, end, size, method, expanded=True):
+        if method == 'astar':
+            search = AStar(start, end, self, size, collect=expanded)
+            path = search.a_star()
+        elif method == 'cpd':
+            # walk the first-move table, no search and so no expanded tiles at all. building a
+            # table takes a Dijkstra search from every tile, far too slow to do inside a query
+            if size not in self.first_moves:
+                raise ValueError("no first-move table for size %d, load one with "
+                                 "load_first_moves or build one offline with cpd.py" % size)
+            path = self.first_moves[size].path(start, end)
+            return path, sum(map(self.__get_action_cost, path)), \
+                ExpandedSet(self.__width, self.__height)
+        elif method == 'alt':
+            if size not in self.landmarks:
+                self.build_landmarks(sizes=[size])
+            search = AStar(start, end, self, size, self.landmark_heuristic(size, end),
+                           collect=expanded)
+            path = search.a_star()
+        elif method == 'hpa':
+            if size not in self.__cluster_graphs:
+                self.__cluster_graphs[size] = ClusterGraph(self, size)
+            path, tiles = self.__cluster_graphs[size].find_path(start, end)
+            return path, sum(map(self.__get_action_cost, path)), \
+                ExpandedSet(self.__width, self.__height, tiles if expanded else ())
+        else:
+            table = self.__jump_table(size) if method == 'jps+' else None
+            search = JumpPointSearch(start, end, self, size, table)
+            path = search.jump_point_search()
+
+        # for some reason, combining these actions
+        # into one line massively decreases performance
+        costs = map(self.__get_action_cost, path)
+        cost_sum = sum(costs)
+
+        if isinstance(search, JumpPointSearch):
+            # jump point search only closes a handful of jump points, kept in a plain set
+            return path, cost_sum, ExpandedSet(self.__width, self.__height,
+                                               search.closed if expanded else ())
+        return path, cost_sum, search.closed
 
     # estimate the cost for moving between start and end
     def estimate_cost(self, start, goal):
@@ -139,107 +890,795 @@ class Grid:
         return cost
 
 
-# the class used to return the calculated path
-class AStar:
-    def __init__(self, start, goal, grid, size):
-        self.start = Node(start)
-        self.closed = set()
-        # using the heapq module for the open list results in notable performance improvements
-        self.open = []
-        heapq.heappush(self.open, self.start)
+# the Grid a batch worker process answers its queries on, set up by init_worker
+worker_grid = None
+
+
+# pool initializer for get_paths, wraps the shared map memory in a Grid without copying it
+# the shared arrays are the tiles, the clearance, the sector layers, the landmark distance arrays
+# and the jump tables, in that order
+def init_worker(shared, layout):
+    global worker_grid
+    width, height, typecodes, (landmark_tiles, jump_sizes) = layout
+    view, offset, arrays = memoryview(shared).cast('B'), 0, []
+    for typecode in typecodes:
+        nbytes = width * height * array(typecode).itemsize
+        arrays.append(view[offset:offset + nbytes].cast(typecode))
+        offset += nbytes
+    layers = len(arrays) - 2 - sum(len(tiles) for _, tiles in landmark_tiles) - \
+        len(jump_sizes) * len(LEGAL_ACTIONS)
+    arrays = iter(arrays)
+    tiles, clearance = next(arrays), next(arrays)
+    sector_grid = [next(arrays) for _ in range(layers)]
+    landmarks = {size: [(tile, next(arrays)) for tile in tiles] for size, tiles in landmark_tiles}
+    jump_tables = {size: [next(arrays) for _ in LEGAL_ACTIONS] for size in jump_sizes}
+    worker_grid = Grid.from_arrays(width, height, tiles, clearance, sector_grid, landmarks,
+                                   jump_tables)
+
+
+# answer one chunk of get_paths queries in a worker process
+def find_paths(chunk):
+    method, expanded, queries = chunk
+    return [worker_grid.get_path(start, end, size, method, expanded)
+            for start, end, size in queries]
+
+
+# the cost to reach one goal from every tile of its sector, for objects of one size
+# every action can be reversed at the same cost, so the backward Dijkstra pass from the goal is a
+# plain Dijkstra search outwards from it. costs[cell] is -1 for tiles that can't reach the goal
+class DistanceField:
+    def __init__(self, grid, goal, size):
         self.goal = goal
         self.size = size
-        self.grid = grid
+        self.width, self.height = grid.width(), grid.height()
+        self.labels = grid.sectors(size)
+        self.label = self.labels[grid.cell_of(goal)]
+        self.costs = array('i', [-1]) * (self.width * self.height)
+        if self.label != 0:
+            self.__dijkstra(grid.cell_of(goal))
+
+    # returns the legal (cell, action, cost) moves out of a cell in the field's sector
+    def moves(self, cell):
+        width, labels, label = self.width, self.labels, self.label
+        x, y = cell % width, cell // width
+        for action in LEGAL_ACTIONS:
+            dx, dy = action
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < width and 0 <= ny < self.height):
+                continue
+            if labels[ny * width + nx] != label:
+                continue
+            if dx and dy:
+                if labels[y * width + nx] != label or labels[ny * width + x] != label:
+                    continue
+                yield ny * width + nx, action, DIAGONAL_COST
+            else:
+                yield ny * width + nx, action, CARDINAL_COST
+
+    def __dijkstra(self, goal):
+        costs = self.costs
+        costs[goal] = 0
+        open_list = [(0, goal)]
+        while open_list:
+            d, cell = heapq.heappop(open_list)
+            if d > costs[cell]:
+                continue
+            for neighbour, action, cost in self.moves(cell):
+                nd = d + cost
+                if costs[neighbour] < 0 or nd < costs[neighbour]:
+                    costs[neighbour] = nd
+                    heapq.heappush(open_list, (nd, neighbour))
 
-    def remove_min_from(self, olist):
-        # return node from open list with the minimum f-cost (f=g + h)
-        return heapq.heappop(olist)
+    # returns the cost from tile to the goal, or -1 if the goal can't be reached from it
+    def cost(self, tile):
+        return self.costs[tile[1] * self.width + tile[0]]
+
+    # returns the (path, cost) from start to the goal in the same form as Grid.get_path, found by
+    # stepping to a neighbour whose cost plus the action cost equals the current cost
+    def path(self, start):
+        cell = start[1] * self.width + start[0]
+        total = self.costs[cell]
+        if total < 0:
+            return [], 0
+        path, costs = [], self.costs
+        while costs[cell] > 0:
+            for neighbour, action, cost in self.moves(cell):
+                if costs[neighbour] == costs[cell] - cost:
+                    path.append(action)
+                    cell = neighbour
+                    break
+        return path, total
+
+
+# the best action towards one goal from every tile of its sector, for objects of one size
+# actions[cell] is an index into LEGAL_ACTIONS, or -1 on the goal and on tiles that can't reach it
+# any number of units heading to the same goal steer with one lookup per tick. the actions are
+# read off the goal's DistanceField: the best action from a tile is the one whose action cost
+# plus the neighbour's cost is lowest, worked out for the whole map at once with NumPy if it's
+# installed, and tile by tile otherwise
+class FlowField:
+    def __init__(self, grid, goal, size):
+        self.goal = goal
+        self.size = size
+        self.width, self.height = grid.width(), grid.height()
+        field = grid.distance_field(goal, size)
+        if np is not None:
+            self.actions = self.__vectorized(field.costs)
+        else:
+            self.actions = array('b', [-1]) * (self.width * self.height)
+            for cell, cost in enumerate(field.costs):
+                if cost > 0:
+                    neighbour, action, step = min(field.moves(cell),
+                                                  key=lambda move: move[2] + field.costs[move[0]])
+                    self.actions[cell] = LEGAL_ACTIONS.index(action)
 
-    def add_to_open(self, node):
-        heapq.heappush(self.open, node)
+    # the same rule as the loop above over whole shifted copies of the cost array, a tile's
+    # neighbours are legal exactly when they and the corners they cut have a cost too, since
+    # the costs cover the goal's sector and nothing else
+    def __vectorized(self, costs):
+        height, width = self.height, self.width
+        costs = np.frombuffer(costs, dtype=np.int32).reshape(height, width).astype(np.int64)
+        inside = costs >= 0
+        unreachable = np.iinfo(np.int64).max
 
-    def add_to_closed(self, state):
-        self.closed.add(state)
+        # shifted(a, dx, dy)[y, x] = a[y + dy, x + dx], or fill off the edge of the map
+        def shifted(a, dx, dy, fill):
+            out = np.full_like(a, fill)
+            out[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)] = \
+                a[max(0, dy):height + min(0, dy), max(0, dx):width + min(0, dx)]
+            return out
 
-    def is_in_open(self, node):
-        return node in self.open
+        best = np.full((height, width), unreachable, dtype=np.int64)
+        actions = np.full((height, width), -1, dtype=np.int8)
+        for i, (dx, dy) in enumerate(LEGAL_ACTIONS):
+            legal = inside & shifted(inside, dx, dy, False)
+            if dx and dy:
+                legal &= shifted(inside, dx, 0, False) & shifted(inside, 0, dy, False)
+            step = DIAGONAL_COST if dx and dy else CARDINAL_COST
+            candidate = np.where(legal, shifted(costs, dx, dy, 0) + step, unreachable)
+            better = candidate < best
+            best[better] = candidate[better]
+            actions[better] = i
+        actions[costs <= 0] = -1
+        return array('b', actions.tobytes())
 
-    def is_in_closed(self, state):
-        return state in self.closed
+    # returns the best action from tile towards the goal, or None on the goal or off the field
+    def action(self, tile):
+        i = self.actions[tile[1] * self.width + tile[0]]
+        return LEGAL_ACTIONS[i] if i >= 0 else None
+
+    # returns the actions from start to the goal found by following the field
+    def path(self, start):
+        actions, width, path = self.actions, self.width, []
+        cell = start[1] * width + start[0]
+        while actions[cell] >= 0:
+            action = LEGAL_ACTIONS[actions[cell]]
+            path.append(action)
+            cell += action[1] * width + action[0]
+        return path
+
+
+# bounded least recently used cache of get_path results, keyed by (start, goal, size, method)
+# the bound is on the total number of path actions and expanded tiles held, and the cache is
+# emptied as soon as it is used with a different map version, so map edits never serve stale paths
+class PathCache:
+    def __init__(self, limit=PATH_CACHE_LIMIT):
+        self.limit = limit  # the most path actions + expanded bitmap bytes the cache may hold
+        self.used = 0  # path actions + expanded bitmap bytes currently held
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # the map version the cached results were computed for
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    # returns the cached (path, cost, expanded) for key, or None if it isn't cached
+    def get(self, key, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return list(entry[0]), entry[1], entry[2]
+
+    # store a (path, cost, expanded) result, evicting the least recently used ones to make room
+    def put(self, key, version, result):
+        if version != self.version:
+            self.clear()
+            self.version = version
+        path, cost, expanded = result
+        # the expanded tiles are charged by the size of their bitmap, which is what they take up
+        size = len(path) + len(expanded.bits) + 1
+        if size > self.limit:
+            return
+        if key in self.__entries:
+            self.used -= self.__entries.pop(key)[3]
+        while self.used + size > self.limit:
+            self.used -= self.__entries.popitem(last=False)[1][3]
+        self.__entries[key] = (tuple(path), cost, expanded, size)
+        self.used += size
+
+    def clear(self):
+        self.__entries.clear()
+        self.used = 0
+
+
+# the tiles a search expanded, stored as one bit per cell id of the map
+# it can be used like a set of (x, y) tiles, len, in and iteration all work on the bitmap, and
+# tiles gives a frozenset of the tuples that is only made the first time it is asked for
+# the bitmap is only allocated when the first tile is added, so the empty sets handed back for
+# disconnected pairs and expanded=False queries cost next to nothing
+class ExpandedSet:
+    def __init__(self, width, height, tiles=()):
+        self.width = width
+        self.height = height
+        self.bits = bytearray()  # bit cell & 7 of byte cell >> 3, empty until the first add
+        self.__count = None
+        self.__tiles = None
+        for x, y in tiles:
+            self.add_cell(y * width + x)
+
+    # returns the bitmap, allocating it if nothing has been added yet
+    def bitmap(self):
+        if not self.bits:
+            self.bits = bytearray((self.width * self.height + 7) >> 3)
+        return self.bits
+
+    def add_cell(self, cell):
+        if not self.bits:
+            self.bitmap()
+        self.bits[cell >> 3] |= 1 << (cell & 7)
+        self.__count = self.__tiles = None
+
+    def has_cell(self, cell):
+        return cell >> 3 < len(self.bits) and self.bits[cell >> 3] >> (cell & 7) & 1 == 1
+
+    # yields the expanded cell ids in increasing order, skipping empty bytes eight cells at a time
+    def cells(self):
+        for i, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                yield (i << 3) + low.bit_length() - 1
+                byte ^= low
+
+    def __len__(self):
+        if self.__count is None:
+            self.__count = int.from_bytes(self.bits, 'little').bit_count()
+        return self.__count
+
+    def __contains__(self, tile):
+        x, y = tile
+        return 0 <= x < self.width and 0 <= y < self.height and self.has_cell(y * self.width + x)
+
+    def __iter__(self):
+        width = self.width
+        for cell in self.cells():
+            yield cell % width, cell // width
+
+    @property
+    def tiles(self):
+        if self.__tiles is None:
+            self.__tiles = frozenset(self)
+        return self.__tiles
+
+
+# binary min-heap of items with priorities that also keeps the heap position of every item
+# membership tests are O(1), and an item's priority can be lowered in place in O(log n)
+# items are ordered by f-cost with ties going to the higher g-cost, so the search goes deeper
+class IndexedHeap:
+    def __init__(self):
+        self.__heap = []  # heap ordered list of [(f, -g), item] pairs
+        self.__index = {}  # index[item] = position of item's pair in the heap
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def __contains__(self, item):
+        return item in self.__index
+
+    # iterates over the items in no particular order
+    def __iter__(self):
+        return iter(self.__index)
+
+    def priority(self, item):
+        return self.__heap[self.__index[item]][0][0]
+
+    # returns the lowest f-cost in the heap
+    def peek(self):
+        return self.__heap[0][0][0]
+
+    def push(self, item, f, g=0):
+        self.__heap.append([(f, -g), item])
+        self.__index[item] = len(self.__heap) - 1
+        self.__sift_up(len(self.__heap) - 1)
+
+    # remove and return the item with the lowest priority
+    def pop(self):
+        heap = self.__heap
+        last = heap.pop()
+        if not heap:
+            del self.__index[last[1]]
+            return last[1]
+        top = heap[0]
+        heap[0] = last
+        self.__index[last[1]] = 0
+        del self.__index[top[1]]
+        self.__sift_down(0)
+        return top[1]
+
+    # lower the priority of an item that is already in the heap
+    def decrease(self, item, f, g=0):
+        i = self.__index[item]
+        self.__heap[i][0] = (f, -g)
+        self.__sift_up(i)
+
+    def __sift_up(self, i):
+        heap, index = self.__heap, self.__index
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not entry[0] < heap[parent][0]:
+                break
+            heap[i] = heap[parent]
+            index[heap[i][1]] = i
+            i = parent
+        heap[i] = entry
+        index[entry[1]] = i
+
+    def __sift_down(self, i):
+        heap, index = self.__heap, self.__index
+        entry, n = heap[i], len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if not heap[child][0] < entry[0]:
+                break
+            heap[i] = heap[child]
+            index[heap[i][1]] = i
+            i = child
+        heap[i] = entry
+        index[entry[1]] = i
+
+
+# open list that buckets items by their integer f-cost, every action cost and heuristic value is
+# an integer so a query only ever sees a few hundred distinct f-costs. those are kept in a small
+# heap of plain ints, and each bucket is a heap of (-g, item) so ties go to the deeper item
+# lowering an item's priority just pushes a new entry, the old one is skipped when it comes up
+class BucketQueue:
+    def __init__(self):
+        self.__buckets = {}  # buckets[f] = heap of (-g, item) entries with that f-cost
+        self.__costs = []  # heap of the f-costs that have a bucket
+        self.__entries = {}  # entries[item] = (f, g) of the live entry of every queued item
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, item):
+        return item in self.__entries
+
+    def priority(self, item):
+        return self.__entries[item][0]
+
+    def push(self, item, f, g=0):
+        self.__entries[item] = (f, g)
+        bucket = self.__buckets.get(f)
+        if bucket is None:
+            bucket = self.__buckets[f] = []
+            heapq.heappush(self.__costs, f)
+        heapq.heappush(bucket, (-g, item))
+
+    # lower the priority of an item that is already in the queue
+    decrease = push
+
+    # remove and return the item with the lowest f-cost, the deepest one on ties
+    def pop(self):
+        buckets, costs, entries = self.__buckets, self.__costs, self.__entries
+        while True:
+            f = costs[0]
+            bucket = buckets[f]
+            while bucket:
+                g, item = heapq.heappop(bucket)
+                if entries.get(item) == (f, -g):
+                    del entries[item]
+                    if not bucket:
+                        del buckets[f]
+                        heapq.heappop(costs)
+                    return item
+            del buckets[f]
+            heapq.heappop(costs)
+
+
+# per-cell search state kept in flat arrays indexed by cell id, shared by every search on a grid
+# a cell's g-cost and parent are only valid while its stamp matches the current generation, so
+# starting a new search is a single increment instead of clearing width * height entries
+class SearchSpace:
+    def __init__(self, cells):
+        self.generation = 0
+        self.stamp = array('I', [0]) * cells  # stamp[cell] = generation its g and parent are from
+        self.closed = array('I', [0]) * cells  # closed[cell] = generation it was expanded in
+        self.g = array('i', [0]) * cells
+        self.parent = array('b', [0]) * cells  # LEGAL_ACTIONS index of the move into the cell
+
+    # start a new search and return its generation
+    def reset(self):
+        self.generation += 1
+        if self.generation > 0xffffffff:
+            # the stamps would wrap around, so clear them once and start counting again
+            self.stamp = array('I', [0]) * len(self.stamp)
+            self.closed = array('I', [0]) * len(self.closed)
+            self.generation = 1
+        return self.generation
+
+
+# returns the (index, dx, dy, cell offset, cost) of every legal action on a map of a given width
+def cell_moves(width):
+    return [(i, dx, dy, dy * width + dx, DIAGONAL_COST if dx and dy else CARDINAL_COST)
+            for i, (dx, dy) in enumerate(LEGAL_ACTIONS)]
+
+
+# octile distance between two cells on a map of a given width
+def octile(a, b, width):
+    dx, dy = abs(a % width - b % width), abs(a // width - b // width)
+    if dx > dy:
+        return DIAGONAL_COST * dy + CARDINAL_COST * (dx - dy)
+    return DIAGONAL_COST * dx + CARDINAL_COST * (dy - dx)
+
+
+# the class used to return the calculated path
+# the search works on cell ids and keeps its g-costs, parents and closed flags in the grid's
+# SearchSpace, so expanding a tile allocates nothing but its open list entry
+class AStar:
+    def __init__(self, start, goal, grid, size, heuristic=None, queue=BucketQueue,
+                 collect=True):
+        self.width, self.height = grid.width(), grid.height()
+        self.start = grid.cell_of(start)
+        self.goal = grid.cell_of(goal)
+        self.size = size
+        self.grid = grid
+        self.labels = grid.sectors(size)
+        self.space = grid.search_space()
+        # the estimate of the cost from a cell to the goal, octile distance unless something
+        # better is given
+        self.heuristic = heuristic or self.octile
+        # the open list is keyed by cell, so membership tests are O(1) and a cell whose g-cost
+        # improves is moved up instead of breaking the queue order. BucketQueue by default,
+        # IndexedHeap is the general binary heap for heuristics that aren't integers
+        self.open = queue()
+        # the expanded cells, left empty if the caller doesn't want them
+        self.closed = ExpandedSet(self.width, self.height)
+        self.collect = collect
+
+    # octile distance from a cell to the goal
+    def octile(self, cell):
+        return octile(cell, self.goal, self.width)
 
     def a_star(self):
-        while self.open:
-            node = self.remove_min_from(self.open)
-            # check if we have found the goal
-            if node.state == self.goal:
-                path = self.reconstruct_path(node)
-                return path
+        space, open_list, heuristic = self.space, self.open, self.heuristic
+        generation = space.reset()
+        stamp, closed, g, parent = space.stamp, space.closed, space.g, space.parent
+        width, height, labels = self.width, self.height, self.labels
+        moves, goal = cell_moves(width), self.goal
+        bits = self.closed.bitmap() if self.collect else None
+        # every tile an object can legally reach is in the start's sector, so a move is legal
+        # when the tiles it enters (and cuts past, if diagonal) carry the same sector label
+        label = labels[self.start]
 
-            self.add_to_closed(node.state)
+        stamp[self.start], g[self.start] = generation, 0
+        open_list.push(self.start, heuristic(self.start), 0)
+        while open_list:
+            cell = open_list.pop()
+            # check if we have found the goal
+            if cell == goal:
+                return self.reconstruct_path(cell)
+            closed[cell] = generation
+            if bits is not None:
+                bits[cell >> 3] |= 1 << (cell & 7)
 
-            for child in children(node, self.grid, self.size):
-                if self.is_in_closed(child.state):
+            y, x = divmod(cell, width)
+            cell_g = g[cell]
+            for i, dx, dy, offset, cost in moves:
+                if not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                child = cell + offset
+                if labels[child] != label or closed[child] == generation:
                     continue
+                if dx and dy and (labels[cell + dx] != label or labels[cell + dy * width] != label):
+                    continue
+                new_g = cell_g + cost
+                if stamp[child] != generation:
+                    stamp[child], g[child], parent[child] = generation, new_g, i
+                    open_list.push(child, new_g + heuristic(child), new_g)
                 # if child is already in open but has more efficient g-cost then update it
-                if self.is_in_open(child):
-                    new_g = node.g + self.grid.estimate_cost(node.state, child.state)
-                    if child.g > new_g:
-                        child.g = new_g
-                        child.parent = node
-                        child.action = (child.state[0] - node.state[0], child.state[1] -
-                                        node.state[1])
-                    else:
-                        continue
-                # calculate child's g-cost and add it to the open list
+                elif new_g < g[child]:
+                    g[child], parent[child] = new_g, i
+                    open_list.decrease(child, new_g + heuristic(child), new_g)
+        return []
+
+    # return the actions of the optimal path that leads to the cell, by following the parent
+    # moves back to the start
+    def reconstruct_path(self, cell):
+        width, parent, path = self.width, self.space.parent, []
+        while cell != self.start:
+            action = LEGAL_ACTIONS[parent[cell]]
+            path.append(action)
+            cell -= action[1] * width + action[0]
+        # return list backwards so the actions are listed start-end
+        return path[::-1]
+
+
+# anytime repairing A* (ARA*) between two tiles, for callers that need a path within a time or
+# expansion budget more than they need the optimal one
+# it starts with an epsilon-weighted heuristic that finds a path quickly, then lowers epsilon step
+# by step down to 1, each time reusing the previous search: cells whose g-cost improves after
+# they were expanded wait on an inconsistent list instead of being expanded again in the same
+# round. every finished round gives a path at most bound times longer than the optimal one, and
+# improve() can be called again on a later tick to carry on from where the budget ran out
+class AnytimeAStar:
+    def __init__(self, start, goal, grid, size, epsilon=ANYTIME_EPSILON):
+        self.start_tile, self.goal_tile = start, goal
+        self.grid = grid
+        self.size = size
+        self.epsilon = epsilon
+        self.__restart()
+
+    # start the whole search over, also done when the map changes under it
+    def __restart(self):
+        grid = self.grid
+        self.width, self.height = grid.width(), grid.height()
+        self.start = grid.cell_of(self.start_tile)
+        self.goal = grid.cell_of(self.goal_tile)
+        self.labels = grid.sectors(self.size)
+        self.version = grid.version()
+        self.eps = self.epsilon  # the weight of the current round
+        self.bound = float('inf')  # suboptimality bound of the best path, inf until there is one
+        self.path, self.cost = [], 0  # the best path found so far
+        self.expanded = ExpandedSet(self.width, self.height)  # cells expanded in any round
+        self.done = not grid.is_connected(self.start_tile, self.goal_tile, self.size)
+        cells = self.width * self.height
+        self.g = array('i', [INFINITE_COST]) * cells
+        self.parent = array('b', [0]) * cells
+        self.round = 1  # closed[cell] = the round that expanded it
+        self.closed = array('I', [0]) * cells
+        self.incons = set()
+        self.open = IndexedHeap()
+        if not self.done:
+            self.g[self.start] = 0
+            self.open.push(self.start, self.eps * octile(self.start, self.goal, self.width), 0)
+
+    # keep searching until the path is optimal or the budget of seconds or expansions runs out,
+    # then return the (path, cost, expanded, bound) of the best path found so far
+    def improve(self, seconds=None, expansions=None):
+        if self.grid.version() != self.version:
+            self.__restart()
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        while not self.done:
+            if not self.__improve_path(deadline, expansions):
+                break
+            self.__publish()
+            if self.bound <= 1:
+                self.done = True
+                break
+            self.__next_round()
+        return self.path, self.cost, self.expanded, self.bound
+
+    # expand cells until the goal can't be reached any cheaper with the current weight, returns
+    # false if the budget ran out first
+    def __improve_path(self, deadline, expansions):
+        g, parent, closed, labels = self.g, self.parent, self.closed, self.labels
+        width, height, goal, eps = self.width, self.height, self.goal, self.eps
+        open_list, current = self.open, self.round
+        label = labels[self.start]
+        moves = cell_moves(width)
+        count = 0
+        while open_list and open_list.peek() < g[goal]:
+            if (expansions is not None and count >= expansions) or \
+                    (deadline is not None and time.perf_counter() > deadline):
+                return False
+            count += 1
+            cell = open_list.pop()
+            closed[cell] = current
+            self.expanded.add_cell(cell)
+            y, x = divmod(cell, width)
+            for i, dx, dy, offset, cost in moves:
+                if not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                child = cell + offset
+                if labels[child] != label:
+                    continue
+                if dx and dy and (labels[cell + dx] != label or labels[cell + dy * width] != label):
+                    continue
+                new_g = g[cell] + cost
+                if new_g >= g[child]:
+                    continue
+                g[child], parent[child] = new_g, i
+                if closed[child] == current:
+                    self.incons.add(child)
+                elif child in open_list:
+                    open_list.decrease(child, new_g + eps * octile(child, goal, width), new_g)
                 else:
-                    child.g = node.g + self.grid.estimate_cost(node.state, child.state)
-                    child.f = child.g + self.grid.estimate_cost(child.state, self.goal)
+                    open_list.push(child, new_g + eps * octile(child, goal, width), new_g)
+        return True
+
+    # record the path the finished round found and how far from optimal it can be
+    # the cost is added up along the path itself: cells on it whose g-cost improved after their
+    # children were reached are still waiting on the inconsistent list, so the path their parents
+    # lead along can be cheaper than g[goal] says
+    def __publish(self):
+        g, goal, width = self.g, self.goal, self.width
+        path, cost, cell = [], 0, goal
+        while cell != self.start:
+            action = LEGAL_ACTIONS[self.parent[cell]]
+            path.append(action)
+            cost += DIAGONAL_COST if action[0] and action[1] else CARDINAL_COST
+            cell -= action[1] * width + action[0]
+        self.path, self.cost = path[::-1], cost
+        # every unfinished cell gives a lower bound on the optimal cost through it
+        lower = min([g[cell] + octile(cell, goal, width)
+                     for cell in list(self.open) + list(self.incons)] or [cost])
+        self.bound = min(self.eps, cost / lower) if lower else 1
 
-                    child.parent = node
-                    child.action = (child.state[0] - node.state[0], child.state[1] -
-                                    node.state[1])
+    # lower the weight and queue every cell that still needs work for the next round
+    def __next_round(self):
+        self.eps = max(1, self.eps - ANYTIME_EPSILON_STEP)
+        g, goal, width, eps = self.g, self.goal, self.width, self.eps
+        queue = IndexedHeap()
+        for cell in list(self.open) + list(self.incons):
+            queue.push(cell, g[cell] + eps * octile(cell, goal, width), g[cell])
+        self.open, self.incons = queue, set()
+        self.round += 1
 
-                    self.add_to_open(child)
+
+# jump point search over the tiles of one sector, returns the same optimal paths as AStar
+# costs are uniform and corners may not be cut, so instead of expanding every open neighbour the
+# search only stops on jump points, the tiles where an optimal path may have to change direction
+class JumpPointSearch:
+    def __init__(self, start, goal, grid, size, table=None):
+        self.start = start
+        self.goal = goal
+        self.grid = grid
+        self.size = size
+        self.table = table  # JPS+ jump distances from Grid, None to scan for jump points online
+        self.closed = set()
+        self.width, self.height = grid.width(), grid.height()
+        self.labels = grid.sectors(size)
+        self.label = self.labels[grid.cell_of(start)]
+
+    # a tile can be walked on if it is inside the map and in the sector being searched
+    def walkable(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and \
+               self.labels[y * self.width + x] == self.label
+
+    def jump_point_search(self):
+        g, parent = {self.start: 0}, {self.start: None}
+        # open list entries are (f, -g, tile), ties on f go to the deeper node
+        open_list = [(self.grid.estimate_cost(self.start, self.goal), 0, self.start)]
+        while open_list:
+            node = heapq.heappop(open_list)[2]
+            if node in self.closed:
+                continue
+            if node == self.goal:
+                return self.reconstruct_path(parent)
+            self.closed.add(node)
+
+            for jump_point in self.successors(node, parent[node]):
+                if jump_point in self.closed:
+                    continue
+                # consecutive jump points are on a straight or diagonal line, so the octile
+                # distance between them is the exact cost
+                new_g = g[node] + self.grid.estimate_cost(node, jump_point)
+                if new_g < g.get(jump_point, new_g + 1):
+                    g[jump_point], parent[jump_point] = new_g, node
+                    f = new_g + self.grid.estimate_cost(jump_point, self.goal)
+                    heapq.heappush(open_list, (f, -new_g, jump_point))
         return []
 
-    # return the optimal path of nodes that leads to the goal
-    def reconstruct_path(self, node):
-        path = []
-        # iterate through and pseudo-recursively add each parent in the path
-        while node.parent:
-            path.append(node)
-            node = node.parent
-        path.append(node)
-        state_path = []
-        # convert the parents into their states
-        for n in path:
-            state_path.append(n.action)
-        # return list backwards so parents are listed start-end
-        return state_path[::-1]
-
-
-def children(node, grid, size):
-    x, y = node.state[0], node.state[1]
-    children = []
-
-    # add tiles above, below, and to the left and right of current node if they are connected
-    for d in [(x - 1, y), (x, y - 1), (x + 1, y), (x, y + 1)]:
-        if (0 < d[0] < grid.width()) and (0 < d[1] < grid.height()):
-            if grid.is_connected((x, y), (d[0], d[1]), size):
-                children.append(Node(d))
-
-    return children
-
-
-class Node:
-    def __init__(self, tile):
-        self.state = tile
-        self.action = (0, 0)
-        self.g = self.f = 0
-        self.parent = None
-
-    def __lt__(self, other):
-        return self.f < other.f
-
-    def __eq__(self, other):
-        return self.state == other.state
+    # return the jump points reachable from a node, given the node it was reached from
+    def successors(self, node, parent):
+        x, y = node
+        for dx, dy in self.directions(x, y, parent):
+            if self.table is None:
+                jump_point = self.jump(x, y, dx, dy)
+                if jump_point:
+                    yield jump_point
+            else:
+                for jump_point in self.lookup(x, y, dx, dy):
+                    yield jump_point
+
+    # return the pruned set of directions worth searching from a node reached from parent
+    def directions(self, x, y, parent):
+        if parent is None:
+            return LEGAL_ACTIONS
+        walkable = self.walkable
+        dx, dy = (x > parent[0]) - (x < parent[0]), (y > parent[1]) - (y < parent[1])
+        directions = []
+        if dx and dy:
+            if walkable(x, y + dy):
+                directions.append((0, dy))
+            if walkable(x + dx, y):
+                directions.append((dx, 0))
+                if walkable(x, y + dy):
+                    directions.append((dx, dy))
+        elif dx:
+            for side in (-1, 1):
+                if walkable(x, y + side):
+                    directions.append((0, side))
+                    if walkable(x + dx, y):
+                        directions.append((dx, side))
+            if walkable(x + dx, y):
+                directions.append((dx, 0))
+        else:
+            for side in (-1, 1):
+                if walkable(x + side, y):
+                    directions.append((side, 0))
+                    if walkable(x, y + dy):
+                        directions.append((side, dy))
+            if walkable(x, y + dy):
+                directions.append((0, dy))
+        return directions
+
+    # step from (x, y) in direction (dx, dy) until a jump point is found, or None if a wall is hit
+    def jump(self, x, y, dx, dy):
+        walkable, goal = self.walkable, self.goal
+        while True:
+            if dx and dy and not (walkable(x + dx, y) and walkable(x, y + dy)):
+                return None
+            x, y = x + dx, y + dy
+            if not walkable(x, y):
+                return None
+            if (x, y) == goal:
+                return x, y
+            if dx and dy:
+                # a diagonal step is a jump point if either straight ray from it finds one
+                if self.jump(x, y, dx, 0) or self.jump(x, y, 0, dy):
+                    return x, y
+            elif is_forced(walkable, x, y, dx, dy):
+                return x, y
+
+    # the JPS+ version of jump, which reads the jump point off the precomputed table and only has
+    # to check whether the goal lies on the way
+    def lookup(self, x, y, dx, dy):
+        dist = self.table[LEGAL_ACTIONS.index((dx, dy))][y * self.width + x]
+        gx, gy = self.goal[0] - x, self.goal[1] - y
+        if dx and dy:
+            # stop where the diagonal meets the goal's row or column, a straight ray may finish
+            if (gx > 0) - (gx < 0) == dx and (gy > 0) - (gy < 0) == dy:
+                k = min(abs(gx), abs(gy))
+                if k <= abs(dist):
+                    yield x + k * dx, y + k * dy
+                    if k == dist:
+                        return
+        elif (dx and gy == 0 and gx * dx > 0) or (dy and gx == 0 and gy * dy > 0):
+            if abs(gx + gy) <= abs(dist):
+                yield self.goal
+                return
+        if dist > 0:
+            yield x + dist * dx, y + dist * dy
+
+    # return the list of unit actions between the jump points that lead to the goal
+    def reconstruct_path(self, parent):
+        path, node = [], self.goal
+        while parent[node] is not None:
+            previous = parent[node]
+            dx, dy = node[0] - previous[0], node[1] - previous[1]
+            steps = max(abs(dx), abs(dy))
+            path.extend([((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))] * steps)
+            node = previous
+        return path[::-1]
+
+
+# returns true if a tile reached by a straight step in direction (dx, dy) has a forced neighbour
+# since corners can't be cut, a tile beside the ray is forced when the tile before it is blocked
+def is_forced(walkable, x, y, dx, dy):
+    if dx:
+        return (walkable(x, y - 1) and not walkable(x - dx, y - 1)) or \
+               (walkable(x, y + 1) and not walkable(x - dx, y + 1))
+    return (walkable(x - 1, y) and not walkable(x - 1, y - dy)) or \
+           (walkable(x + 1, y) and not walkable(x + 1, y - dy))
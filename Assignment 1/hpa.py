@@ -0,0 +1,205 @@
+import heapq
+
+from settings import *  # use a separate file for all the constant settings
+
+
+# hierarchical path-finding A* (HPA*) abstraction of a Grid for a single object size
+# the map is cut into CLUSTER_SIZE x CLUSTER_SIZE clusters, every run of open tiles along a
+# cluster border becomes one or two entrances, and the entrance tiles of each cluster are linked
+# by their shortest distance inside the cluster. queries search this small abstract graph and
+# then refine each abstract edge into tile actions, caching the refinements as they are needed
+# the paths found are near-optimal rather than optimal, since they must pass through entrances
+class ClusterGraph:
+    def __init__(self, grid, size, cluster_size=CLUSTER_SIZE):
+        self.grid = grid
+        self.size = size
+        self.cluster_size = cluster_size
+        self.width, self.height = grid.width(), grid.height()
+        self.labels = grid.sectors(size)
+        self.edges = {}  # edges[a][b] = cost of the abstract edge between entrance tiles a and b
+        self.entrances = {}  # entrances[cluster] = list of the entrance tiles inside the cluster
+        self.paths = {}  # paths[(a, b)] = refined actions of an intra-cluster edge, filled lazily
+        self.__build_entrances()
+        self.__build_intra_edges()
+
+    # returns the (x, y) index of the cluster a tile belongs to
+    def cluster_of(self, tile):
+        return tile[0] // self.cluster_size, tile[1] // self.cluster_size
+
+    # returns the tile bounds (x0, y0, x1, y1) of a cluster, the upper bounds are exclusive
+    def bounds(self, cluster):
+        x0, y0 = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return x0, y0, min(x0 + self.cluster_size, self.width), min(y0 + self.cluster_size,
+                                                                      self.height)
+
+    def __add_edge(self, a, b, cost):
+        self.edges.setdefault(a, {})[b] = cost
+        self.edges.setdefault(b, {})[a] = cost
+
+    # find the runs of tiles on both sides of every cluster border that an object can cross
+    def __build_entrances(self):
+        cs, labels, width = self.cluster_size, self.labels, self.width
+        # vertical borders between tile columns x - 1 and x, then horizontal ones between rows
+        borders = [((x - 1, y0), (x, y0), (0, 1), min(cs, self.height - y0))
+                   for x in range(cs, width, cs) for y0 in range(0, self.height, cs)]
+        borders += [((x0, y - 1), (x0, y), (1, 0), min(cs, width - x0))
+                    for y in range(cs, self.height, cs) for x0 in range(0, width, cs)]
+
+        for near, far, step, length in borders:
+            run, run_label = [], 0
+            for i in range(length + 1):
+                a = (near[0] + i * step[0], near[1] + i * step[1])
+                b = (far[0] + i * step[0], far[1] + i * step[1])
+                label = labels[a[1] * width + a[0]] if i < length else 0
+                if label != 0 and label == labels[b[1] * width + b[0]] and \
+                        (not run or label == run_label):
+                    run.append((a, b))
+                    run_label = label
+                    continue
+                # the run has ended: short runs get one transition in the middle, long runs get
+                # one at each end so paths don't have to detour through the middle
+                if len(run) >= ENTRANCE_WIDTH:
+                    transitions = [run[0], run[-1]]
+                elif run:
+                    transitions = [run[len(run) // 2]]
+                else:
+                    transitions = []
+                for a_tile, b_tile in transitions:
+                    self.__add_edge(a_tile, b_tile, CARDINAL_COST)
+                # the tile pair that ended the run may start the next one
+                if label != 0 and label == labels[b[1] * width + b[0]]:
+                    run, run_label = [(a, b)], label
+                else:
+                    run = []
+
+    # link the entrance tiles of every cluster by their shortest distance inside the cluster
+    def __build_intra_edges(self):
+        for tile in self.edges:
+            self.entrances.setdefault(self.cluster_of(tile), []).append(tile)
+        for tiles in self.entrances.values():
+            for i, a in enumerate(tiles):
+                dist = self.local_search(a, tiles[i + 1:])[0]
+                for b in tiles[i + 1:]:
+                    if b in dist:
+                        self.__add_edge(a, b, dist[b])
+
+    # Dijkstra search from start that never leaves start's cluster, stops once every target tile
+    # has been settled and returns the (distance, parent) dictionaries of the settled tiles
+    def local_search(self, start, targets):
+        x0, y0, x1, y1 = self.bounds(self.cluster_of(start))
+        width, labels = self.width, self.labels
+        label = labels[start[1] * width + start[0]]
+        remaining = set(targets)
+        remaining.discard(start)
+        dist, parent, settled = {start: 0}, {start: None}, {}
+        open_list = [(0, start)]
+        while open_list and remaining:
+            d, tile = heapq.heappop(open_list)
+            if tile in settled:
+                continue
+            settled[tile] = d
+            remaining.discard(tile)
+            x, y = tile
+            for dx, dy in LEGAL_ACTIONS:
+                nx, ny = x + dx, y + dy
+                if not (x0 <= nx < x1 and y0 <= ny < y1) or labels[ny * width + nx] != label:
+                    continue
+                # no corner cutting, the corners are inside the cluster whenever the move is
+                if dx and dy and (labels[y * width + nx] != label or
+                                  labels[ny * width + x] != label):
+                    continue
+                nd = d + (DIAGONAL_COST if dx and dy else CARDINAL_COST)
+                if nd < dist.get((nx, ny), nd + 1):
+                    dist[(nx, ny)], parent[(nx, ny)] = nd, tile
+                    heapq.heappush(open_list, (nd, (nx, ny)))
+        return settled, parent
+
+    # returns the actions that lead from start to tile along the parents of a local search
+    @staticmethod
+    def actions(parent, tile):
+        path = []
+        while parent[tile] is not None:
+            previous = parent[tile]
+            path.append((tile[0] - previous[0], tile[1] - previous[1]))
+            tile = previous
+        return path[::-1]
+
+    # returns the entrance tiles of start's cluster in start's sector, plus goal if it shares the
+    # cluster, so that the local search doesn't keep looking for tiles it can never reach
+    def __local_targets(self, start, goal):
+        cluster, width = self.cluster_of(start), self.width
+        label = self.labels[start[1] * width + start[0]]
+        targets = [tile for tile in self.entrances.get(cluster, [])
+                   if self.labels[tile[1] * width + tile[0]] == label]
+        if self.cluster_of(goal) == cluster:
+            targets.append(goal)
+        return targets
+
+    # returns the (actions, expanded tiles) of a path from start to goal, searching the abstract
+    # graph with start and goal temporarily inserted into it, or ([], expanded) if there is none
+    def find_path(self, start, goal):
+        expanded = set()
+        # connect start and goal to the entrances of their clusters, the goal search runs from the
+        # goal since every move can be reversed at the same cost
+        start_dist, start_parent = self.local_search(start, self.__local_targets(start, goal))
+        goal_dist, goal_parent = self.local_search(goal, self.__local_targets(goal, start))
+        expanded.update(start_dist, goal_dist)
+
+        def neighbours(tile):
+            for other, cost in self.edges.get(tile, {}).items():
+                yield other, cost
+            if tile == start:
+                for other, cost in start_dist.items():
+                    if other in self.edges or other == goal:
+                        yield other, cost
+            elif tile in goal_dist and (tile in self.edges or tile == start):
+                yield goal, goal_dist[tile]
+
+        # A* over the abstract graph, entries are (f, -g, tile) so ties go to the deeper node
+        g, parent = {start: 0}, {start: None}
+        open_list = [(self.grid.estimate_cost(start, goal), 0, start)]
+        closed = set()
+        while open_list:
+            tile = heapq.heappop(open_list)[2]
+            if tile in closed:
+                continue
+            if tile == goal:
+                break
+            closed.add(tile)
+            for other, cost in neighbours(tile):
+                new_g = g[tile] + cost
+                if other not in closed and new_g < g.get(other, new_g + 1):
+                    g[other], parent[other] = new_g, tile
+                    heapq.heappush(open_list, (new_g + self.grid.estimate_cost(other, goal), -new_g,
+                                               other))
+        else:
+            return [], expanded | closed
+        expanded |= closed
+
+        # walk the abstract path back from the goal and refine each of its edges
+        nodes = [goal]
+        while parent[nodes[-1]] is not None:
+            nodes.append(parent[nodes[-1]])
+        nodes.reverse()
+        path = []
+        for a, b in zip(nodes, nodes[1:]):
+            path.extend(self.refine(a, b, (start, start_dist, start_parent),
+                                    (goal, goal_dist, goal_parent)))
+        return path, expanded
+
+    # returns the actions of a single abstract edge, intra-cluster edges are searched for the
+    # first time they are used and cached from then on
+    # the start and goal arguments are the (tile, distance, parent) results of their local searches
+    def refine(self, a, b, start, goal):
+        if a == start[0] and b in start[1]:
+            return self.actions(start[2], b)
+        if b == goal[0] and a in goal[1]:
+            # the goal search ran backwards, so reverse its path and flip every action
+            return [(-dx, -dy) for dx, dy in reversed(self.actions(goal[2], a))]
+        if self.cluster_of(a) != self.cluster_of(b):
+            return [(b[0] - a[0], b[1] - a[1])]
+        if (a, b) not in self.paths:
+            path = self.actions(self.local_search(a, [b])[1], b)
+            self.paths[(a, b)] = path
+            self.paths[(b, a)] = [(-dx, -dy) for dx, dy in reversed(path)]
+        return self.paths[(a, b)]
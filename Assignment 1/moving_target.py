@@ -0,0 +1,137 @@
+from array import array
+
+from settings import *  # use a separate file for all the constant settings
+from grid_student import BucketQueue, ExpandedSet, cell_moves, octile
+
+
+# Generalized Adaptive A* (GAA*) for an object of one size chasing a goal that keeps moving
+# every search is an A* search whose heuristics are learned from the searches before it: a cell
+# expanded by a search that found a path of cost c gets h = c - g, which is still consistent and
+# usually much better informed than the octile distance. when the goal moves, the learned values
+# are lowered by the old heuristic of the new goal so they stay consistent for it. values are
+# fixed up lazily, the first time a later search touches a cell, so nothing is cleared in between
+# if neither the start nor the map has changed and the new goal was expanded by the last search,
+# its optimal path is read straight off that search tree without searching at all
+class MovingTargetSearch:
+    def __init__(self, grid, size):
+        self.grid = grid
+        self.size = size
+        self.width, self.height = grid.width(), grid.height()
+        self.__reset()
+
+    # forget everything learned, when the map changes the learned heuristics may overestimate
+    def __reset(self):
+        cells = self.width * self.height
+        self.counter = 0  # the id of the latest search
+        self.search = array('I', [0]) * cells  # search[cell] = id of the search that last saw it
+        self.closed = array('I', [0]) * cells  # closed[cell] = id of the search that expanded it
+        self.g = array('i', [0]) * cells
+        self.h = array('i', [0]) * cells
+        self.parent = array('b', [0]) * cells  # LEGAL_ACTIONS index of the move into the cell
+        self.pathcost = [None]  # pathcost[id] = cost of the path found by search id, if any
+        self.deltah = [0]  # deltah[id] = total heuristic correction for goal moves up to search id
+        self.start = self.goal = -1  # start and goal cells of the latest search
+        self.version = self.grid.version()
+
+    # bring a cell's g and h up to date for the current search
+    def __initialize(self, cell, goal):
+        seen, counter, g, h = self.search[cell], self.counter, self.g, self.h
+        if seen == counter:
+            return
+        if seen == 0:
+            h[cell] = octile(cell, goal, self.width)
+        else:
+            cost = self.pathcost[seen]
+            if cost is not None and self.closed[cell] == seen and g[cell] + h[cell] < cost:
+                h[cell] = cost - g[cell]
+            h[cell] = max(h[cell] - (self.deltah[counter] - self.deltah[seen]),
+                          octile(cell, goal, self.width))
+        g[cell] = INFINITE_COST
+        self.search[cell] = counter
+
+    # returns the (path, cost, expanded) of an optimal path from start to goal, like get_path
+    # cancel is an optional threading.Event, once it is set the search gives up and returns None
+    # whatever it had closed by then has its optimal g-cost, so the next searches can still use it
+    def find_path(self, start, goal, cancel=None):
+        grid, width = self.grid, self.width
+        if not grid.is_connected(start, goal, self.size):
+            return [], 0, ExpandedSet(width, self.height)
+        if grid.version() != self.version:
+            self.__reset()
+        s, t = grid.cell_of(start), grid.cell_of(goal)
+
+        if self.counter and s == self.start and self.closed[t] == self.counter:
+            # the last search from this start already settled the goal
+            return self.__path(s, t), self.g[t], ExpandedSet(width, self.height)
+
+        delta = self.deltah[self.counter]
+        if self.counter and t != self.goal:
+            # correct the heuristics learned for the last goal by how far the goal may have moved
+            self.__initialize(t, self.goal)
+            cost = self.pathcost[self.counter]
+            if cost is not None and self.g[t] != INFINITE_COST and self.g[t] + self.h[t] < cost:
+                self.h[t] = cost - self.g[t]
+            delta += self.h[t]
+        self.counter += 1
+        self.deltah.append(delta)
+        self.pathcost.append(None)
+        self.start, self.goal = s, t
+        expanded = self.__search(s, t, cancel)
+        if expanded is None:
+            return None
+        return self.__path(s, t), self.g[t], expanded
+
+    # A* from s to t over the shared arrays, leaving g, parent and closed for the next searches
+    def __search(self, s, t, cancel=None):
+        width, height, counter = self.width, self.height, self.counter
+        g, h, parent, closed = self.g, self.h, self.parent, self.closed
+        labels = self.grid.sectors(self.size)
+        label = labels[s]
+        expanded = ExpandedSet(width, self.height)
+        open_list = BucketQueue()
+        moves = cell_moves(width)
+
+        self.__initialize(s, t)
+        self.__initialize(t, t)
+        g[s] = 0
+        open_list.push(s, h[s], 0)
+        while open_list:
+            if cancel is not None and cancel.is_set():
+                return None
+            cell = open_list.pop()
+            if cell == t:
+                self.pathcost[counter] = g[t]
+                break
+            closed[cell] = counter
+            expanded.add_cell(cell)
+            y, x = divmod(cell, width)
+            for i, dx, dy, offset, cost in moves:
+                if not (0 <= x + dx < width and 0 <= y + dy < height):
+                    continue
+                child = cell + offset
+                if labels[child] != label or closed[child] == counter:
+                    continue
+                if dx and dy and (labels[cell + dx] != label or labels[cell + dy * width] != label):
+                    continue
+                self.__initialize(child, t)
+                new_g = g[cell] + cost
+                if new_g < g[child]:
+                    queued = g[child] != INFINITE_COST
+                    g[child], parent[child] = new_g, i
+                    if queued:
+                        open_list.decrease(child, new_g + h[child], new_g)
+                    else:
+                        open_list.push(child, new_g + h[child], new_g)
+        # the goal counts as expanded so the next search can reuse the tree to reach it
+        closed[t] = counter
+        return expanded
+
+    # returns the actions from s to t along the parents of the latest search
+    def __path(self, s, t):
+        width, parent, path = self.width, self.parent, []
+        cell = t
+        while cell != s:
+            action = LEGAL_ACTIONS[parent[cell]]
+            path.append(action)
+            cell -= action[1] * width + action[0]
+        return path[::-1]
@@ -30,3 +30,22 @@ CARDINAL_COST = 100
 LEGAL_ACTIONS = [(-1, -1), (0, -1), (1, -1),
                  (-1,  0),          (1,  0),
                  (-1,  1), (0,  1), (1,  1)]
+# the search methods Grid.get_path supports
+SEARCH_METHODS = ['astar', 'jps', 'jps+', 'hpa', 'alt', 'cpd']
+CLUSTER_SIZE = 16  # side of the square clusters the 'hpa' search method divides the map into
+ENTRANCE_WIDTH = 6  # cluster border runs at least this long get an entrance at each end
+PATH_CACHE_LIMIT = 1 << 20  # the most path actions + expanded bitmap bytes Grid.path_cache holds
+BATCH_PARALLEL_MIN = 64  # Grid.get_paths answers smaller batches without the worker pool
+FIELD_CACHE_SIZE = 16  # how many distance fields Grid.distance_field keeps around
+FLOW_CACHE_SIZE = 16  # how many flow fields Grid.flow_field keeps around
+MASK_CACHE_SIZE = 16  # how many reachability masks Grid.reachable_mask keeps around
+LANDMARK_COUNT = 8  # how many ALT landmarks Grid.build_landmarks picks for each object size
+LANDMARK_EXTENSION = '.alt'  # landmark tables are saved next to the map file with this extension
+FIRST_MOVE_EXTENSION = '.cpd'  # first-move tables are saved next to the map with this extension
+EDIT_LOG_SIZE = 4096  # how many of the latest tile edits Grid.edits_since can report
+ANYTIME_EPSILON = 3.0  # heuristic weight of the first round of Grid.anytime_search
+ANYTIME_EPSILON_STEP = 0.5  # how much the weight goes down after every round
+INFINITE_COST = 0x7fffffff  # path cost of a tile that hasn't been reached
+COOPERATIVE_WINDOW = 16  # how many steps ahead CooperativePlanner plans each agent
+MAP_EXTENSION = '.bmap'  # binary map files written by Grid.save_map
+GRID_CACHE_EXTENSION = '.grid'  # cached tiles, clearance and sector labels next to each map
@@ -0,0 +1,402 @@
+import heapq
+import os
+import shutil
+import random
+import tempfile
+
+from settings import *  # use a separate file for all the constant settings
+import grid_student  # the grid class for this assignment (student)
+from cooperative import CooperativePlanner, WAIT
+from dstar_lite import DStarLite
+from moving_target import MovingTargetSearch
+
+# regression checks of the optimized Grid against plain reference implementations
+# run with pytest, or on its own with python test_grid.py
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAPS = [os.path.join(HERE, 'map.txt'), os.path.join(HERE, 'map_large.txt')]
+
+
+# plain Dijkstra search over is_legal_action, returns the optimal cost or None if there is no path
+def dijkstra(grid, start, goal, size):
+    if grid.clearance(start) < size:
+        return None
+    dist = {start: 0}
+    open_list = [(0, start)]
+    while open_list:
+        d, tile = heapq.heappop(open_list)
+        if tile == goal:
+            return d
+        if d > dist[tile]:
+            continue
+        for action in LEGAL_ACTIONS:
+            if grid.is_legal_action(tile, action, size):
+                child = (tile[0] + action[0], tile[1] + action[1])
+                nd = d + (DIAGONAL_COST if action[0] and action[1] else CARDINAL_COST)
+                if nd < dist.get(child, nd + 1):
+                    dist[child] = nd
+                    heapq.heappush(open_list, (nd, child))
+    return None
+
+
+# returns the cost of following the actions from start, asserting every one is legal
+def path_cost(grid, start, path, size):
+    tile, cost = start, 0
+    for action in path:
+        assert grid.is_legal_action(tile, action, size), (tile, action)
+        tile = (tile[0] + action[0], tile[1] + action[1])
+        cost += DIAGONAL_COST if action[0] and action[1] else CARDINAL_COST
+    return tile, cost
+
+
+# returns count random (start, goal, size) queries whose start the object fits on, about half of
+# them with the goal picked from the start's sector so that most of them are connected
+def random_queries(grid, count, rng, sizes=range(1, MAX_SIZE + 1)):
+    queries = []
+    while len(queries) < count:
+        size = rng.choice(sizes)
+        labels = grid.sectors(size)
+        start = (rng.randrange(grid.width()), rng.randrange(grid.height()))
+        if labels[grid.cell_of(start)] == 0:
+            continue
+        goal = (rng.randrange(grid.width()), rng.randrange(grid.height()))
+        if rng.random() < 0.5:
+            goal = grid.tile_of(rng.choice([c for c in range(len(labels))
+                                            if labels[c] == labels[grid.cell_of(start)]]))
+        queries.append((start, goal, size))
+    return queries
+
+
+# asserts that get_path with the given method answers random queries like a Dijkstra search
+# would, with optimal paths, or with paths no cheaper than optimal if exact is false
+def check_method(grid, method, exact=True, sizes=range(1, MAX_SIZE + 1), count=60):
+    rng = random.Random(1)
+    for start, goal, size in random_queries(grid, count, rng, sizes):
+        best = dijkstra(grid, start, goal, size)
+        assert grid.is_connected(start, goal, size) == (best is not None)
+        path, cost, expanded = grid.get_path(start, goal, size, method)
+        if best is None:
+            assert (path, cost) == ([], 0), (method, start, goal, size)
+            continue
+        assert path_cost(grid, start, path, size) == (goal, cost), (method, start, goal, size)
+        if exact:
+            assert cost == best, (method, start, goal, size, cost, best)
+        else:
+            assert cost >= best, (method, start, goal, size, cost, best)
+
+
+# asserts that two sector layers split the map into the same sectors, whatever their labels
+def assert_same_sectors(a, b):
+    forward, backward = {}, {}
+    for cell, (x, y) in enumerate(zip(a, b)):
+        assert (x == 0) == (y == 0), cell
+        assert forward.setdefault(x, y) == y and backward.setdefault(y, x) == x, cell
+
+
+def test_set_matches_full_relabel():
+    grid = grid_student.Grid(MAPS[0])
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        for batch in range(10):
+            for _ in range(20):
+                tile = (rng.randrange(grid.width()), rng.randrange(grid.height()))
+                grid.set(tile, rng.randrange(len(TILE_COLOR)))
+            # a Grid loaded from the edited map labels every sector from scratch
+            filename = os.path.join(directory, 'map%d.bmap' % batch)
+            grid.save_map(filename)
+            fresh = grid_student.Grid(filename)
+            for cell in range(grid.width() * grid.height()):
+                tile = grid.tile_of(cell)
+                assert grid.clearance(tile) == fresh.clearance(tile), tile
+            for size in range(1, MAX_SIZE + 1):
+                assert_same_sectors(grid.sectors(size), fresh.sectors(size))
+
+
+def test_a_star_matches_dijkstra():
+    for filename in MAPS:
+        check_method(grid_student.Grid(filename), 'astar')
+
+
+def test_jump_point_search_matches_dijkstra():
+    for filename in MAPS:
+        grid = grid_student.Grid(filename)
+        check_method(grid, 'jps')
+        check_method(grid, 'jps+')
+
+
+def test_hierarchical_search_is_near_optimal():
+    for filename in MAPS:
+        # hpa paths have to go through the cluster entrances, so they may be longer than optimal
+        check_method(grid_student.Grid(filename), 'hpa', exact=False)
+
+
+def test_path_cache_eviction_and_invalidation():
+    empty = grid_student.ExpandedSet(8, 8)
+    expanded = grid_student.ExpandedSet(8, 8, [(1, 1)])
+    cache = grid_student.PathCache(limit=30)
+    # an entry is charged its path length, its expanded bitmap bytes and one
+    cache.put('a', 0, ([(1, 0)] * 10, 1000, empty))
+    cache.put('b', 0, ([(1, 0)] * 10, 1000, expanded))
+    assert cache.used == 11 + 19 and len(cache) == 2
+    # using 'a' makes 'b' the least recently used entry, so it goes first
+    path, cost, _ = cache.get('a', 0)
+    path.append((0, 1))  # the caller gets its own copy of the path
+    cache.put('c', 0, ([(0, 1)] * 10, 1000, empty))
+    assert cache.get('b', 0) is None and len(cache.get('a', 0)[0]) == 10
+    assert cache.used <= cache.limit
+    # a result larger than the whole cache is not stored at all
+    cache.put('d', 0, ([(1, 0)] * 40, 4000, empty))
+    assert cache.get('d', 0) is None
+    # a new map version empties the cache
+    assert cache.get('a', 1) is None and len(cache) == 0 and cache.used == 0
+
+    grid = grid_student.Grid(MAPS[0])
+    start, goal = (21, 3), (46, 3)
+    first = grid.get_path(start, goal, 1)
+    hits = grid.path_cache.hits
+    assert grid.get_path(start, goal, 1)[1] == first[1] and grid.path_cache.hits == hits + 1
+    grid.set((30, 3), 1)  # any edit bumps the map version
+    result = grid.get_path(start, goal, 1)
+    assert grid.path_cache.hits == hits + 1
+    assert result[1] == (dijkstra(grid, start, goal, 1) or 0)
+
+
+def test_pooled_batch_matches_serial():
+    grid = grid_student.Grid(MAPS[1])
+    queries = random_queries(grid, 2 * BATCH_PARALLEL_MIN, random.Random(3))
+    queries += queries[:10]  # repeated queries are only searched once
+    serial = grid.get_paths(queries, processes=1)
+    grid.path_cache.clear()
+    try:
+        pooled = grid.get_paths(queries, processes=2)
+    finally:
+        grid.close()
+    for query, a, b in zip(queries, serial, pooled):
+        assert (a[0], a[1], set(a[2])) == (b[0], b[1], set(b[2])), query
+
+
+def test_distance_field_matches_get_path():
+    grid = grid_student.Grid(MAPS[1])
+    for start, goal, size in random_queries(grid, 40, random.Random(4)):
+        field = grid.distance_field(goal, size)
+        if not grid.is_connected(start, goal, size):
+            assert field.cost(start) == -1 and field.path(start) == ([], 0)
+            continue
+        _, cost, _ = grid.get_path(start, goal, size)
+        assert field.cost(start) == cost, (start, goal, size)
+        path, total = field.path(start)
+        assert total == cost and path_cost(grid, start, path, size) == (goal, cost)
+
+
+def test_landmark_search_matches_dijkstra():
+    for filename in MAPS:
+        check_method(grid_student.Grid(filename), 'alt')
+    # the workers read the landmarks built here from shared memory instead of building their own
+    grid = grid_student.Grid(MAPS[1])
+    queries = random_queries(grid, 2 * BATCH_PARALLEL_MIN, random.Random(6))
+    try:
+        for method in ('alt', 'jps+'):
+            pooled = grid.get_paths(queries, method, processes=2)
+            grid.path_cache.clear()
+            serial = grid.get_paths(queries, method, processes=1)
+            assert [r[:2] for r in pooled] == [r[:2] for r in serial], method
+    finally:
+        grid.close()
+    assert sorted(grid.landmarks) == sorted(set(size for _, _, size in queries))
+
+
+def test_first_move_table_matches_dijkstra():
+    # a table takes a Dijkstra search from every tile, so only the small map's size 1 one is built
+    grid = grid_student.Grid(MAPS[0])
+    grid.build_first_moves([1])
+    check_method(grid, 'cpd', sizes=[1])
+
+
+def test_dstar_lite_matches_get_path():
+    rng = random.Random(3)
+    for trial in range(20):
+        grid = grid_student.Grid(MAPS[0])
+        start, goal, size = next(q for q in random_queries(grid, 100, rng)
+                                 if grid.is_connected(*q))
+        planner = DStarLite(grid, start, goal, size)
+        path, cost = planner.plan()
+        for step in range(30):
+            # edit tiles close to the object, which may leave it on a tile it no longer fits on
+            here = grid.tile_of(planner.start)
+            for _ in range(rng.randint(1, 3)):
+                tile = (min(grid.width() - 1, max(0, here[0] + rng.randint(-6, 6))),
+                        min(grid.height() - 1, max(0, here[1] + rng.randint(-6, 6))))
+                grid.set(tile, rng.randrange(len(TILE_COLOR)))
+            if path and grid.clearance(here) >= size and \
+                    grid.is_legal_action(here, path[0], size):
+                planner.move_to((here[0] + path[0][0], here[1] + path[0][1]))
+            path, cost = planner.plan()
+            here = grid.tile_of(planner.start)
+            expected = grid.get_path(here, goal, size)
+            assert cost == expected[1] and bool(path) == bool(expected[0]), (trial, step)
+            if path:
+                assert path_cost(grid, here, path, size) == (goal, cost)
+
+
+def test_moving_target_matches_get_path():
+    grid = grid_student.Grid(MAPS[1])
+    rng = random.Random(4)
+    for size in range(1, MAX_SIZE + 1):
+        planner = MovingTargetSearch(grid, size)
+        start, goal, _ = next(q for q in random_queries(grid, 100, rng)
+                              if q[2] == size and grid.is_connected(*q))
+        for step in range(40):
+            # the goal wanders a tile at a time, with the odd jump and the odd new start
+            if rng.random() < 0.1:
+                goal = (rng.randrange(grid.width()), rng.randrange(grid.height()))
+            elif rng.random() < 0.1:
+                start = (rng.randrange(grid.width()), rng.randrange(grid.height()))
+            else:
+                action = rng.choice(LEGAL_ACTIONS)
+                if grid.is_legal_action(goal, action, size):
+                    goal = (goal[0] + action[0], goal[1] + action[1])
+            path, cost, expanded = planner.find_path(start, goal)
+            assert cost == grid.get_path(start, goal, size)[1], (size, step)
+            if path:
+                assert path_cost(grid, start, path, size) == (goal, cost)
+
+
+def test_anytime_search_bounds():
+    grid = grid_student.Grid(MAPS[1])
+    rng = random.Random(5)
+    for start, goal, size in random_queries(grid, 30, rng):
+        best = grid.get_path(start, goal, size)[1]
+        search = grid.anytime_search(start, goal, size)
+        while True:
+            path, cost, expanded, bound = search.improve(expansions=rng.randint(50, 500))
+            if path:
+                assert path_cost(grid, start, path, size) == (goal, cost)
+                assert cost <= bound * best + 1e-9
+            if search.done:
+                break
+        assert cost == best
+
+
+def test_cooperative_paths_never_collide():
+    grid = grid_student.Grid(MAPS[0])
+    rng = random.Random(7)
+    for count in (8, 24):
+        # agents of sizes 1 to 3 whose start and goal footprints don't overlap any other agent's
+        agents, taken = [], set()
+        for start, goal, size in random_queries(grid, 1000, rng, sizes=range(1, 4)):
+            if len(agents) == count:
+                break
+            covered = set((tile[0] + dx, tile[1] + dy) for tile in (start, goal)
+                          for dx in range(size) for dy in range(size))
+            if grid.is_connected(start, goal, size) and not covered & taken:
+                agents.append((start, goal, size))
+                taken |= covered
+        paths, arrived = CooperativePlanner(grid).solve(agents)
+
+        positions = [start for start, _, _ in agents]
+        for step in range(max(map(len, paths)) + 1):
+            footprints = {}
+            for agent, ((x, y), (_, _, size)) in enumerate(zip(positions, agents)):
+                for tile in ((x + dx, y + dy) for dx in range(size) for dy in range(size)):
+                    assert footprints.setdefault(tile, agent) == agent, (count, step, tile)
+            moved = []
+            for agent, path in enumerate(paths):
+                action = path[step] if step < len(path) else WAIT
+                if action != WAIT:
+                    assert grid.is_legal_action(positions[agent], action, agents[agent][2])
+                moved.append((positions[agent][0] + action[0], positions[agent][1] + action[1]))
+            # no two agents swap tiles by passing through each other
+            for a in range(len(agents)):
+                for b in range(a + 1, len(agents)):
+                    assert not (moved[a] == positions[b] and moved[b] == positions[a] and
+                                moved[a] != positions[a]), (count, step, a, b)
+            positions = moved
+        assert arrived == [p == goal for p, (_, goal, _) in zip(positions, agents)]
+        assert all(arrived), count
+
+
+def test_flow_field_paths_are_optimal():
+    grid = grid_student.Grid(MAPS[1])
+    numpy = grid_student.np
+    try:
+        # the fields are worked out with NumPy when it is installed, check the plain loop too
+        for np in (numpy, None):
+            grid_student.np = np
+            for start, goal, size in random_queries(grid, 40, random.Random(8)):
+                flow = grid_student.FlowField(grid, goal, size)
+                path = flow.path(start)
+                if not grid.is_connected(start, goal, size):
+                    assert path == [] and flow.action(start) is None
+                    continue
+                best = grid.get_path(start, goal, size)[1]
+                assert path_cost(grid, start, path, size) == (goal, best), (start, goal, size)
+                assert flow.action(goal) is None
+    finally:
+        grid_student.np = numpy
+
+
+def test_reachable_mask_matches_is_connected():
+    grid = grid_student.Grid(MAPS[0])
+    rng = random.Random(9)
+    cells = grid.width() * grid.height()
+    for start, _, size in random_queries(grid, 30, rng) + [((-1, 0), None, 1)]:
+        mask = grid.reachable_mask(start, size)
+        inside = 0 <= start[0] < grid.width() and 0 <= start[1] < grid.height()
+        for cell in rng.sample(range(cells), 200):
+            assert bool(mask[cell]) == (inside and
+                                        grid.is_connected(start, grid.tile_of(cell), size))
+        if grid_student.np is not None:
+            assert grid.reachable_mask(start, size, numpy=True).tobytes() == bytes(mask)
+    # the viewer only redraws its overlay when it is handed a different mask object
+    tile = random_queries(grid, 1, rng, sizes=[1])[0][0]
+    mask = grid.reachable_mask(tile, 1)
+    assert grid.reachable_mask(tile, 1) is mask
+    grid.set((0, 0), (grid.get((0, 0)) + 1) % len(TILE_COLOR))
+    assert grid.reachable_mask(tile, 1) is not mask
+
+
+def test_grid_cache_is_used_and_rebuilt():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'map.txt')
+        cache = filename + GRID_CACHE_EXTENSION
+        shutil.copy(MAPS[0], filename)
+        built = grid_student.Grid(filename)  # no cache yet, so it is written
+        inode = os.stat(cache).st_ino
+        cached = grid_student.Grid(filename)  # the cache is mapped, not written again
+        assert os.stat(cache).st_ino == inode
+        for grid in (built, cached):
+            assert isinstance(grid.tile_array(), memoryview) and grid.tile_array().format == 'B'
+            assert all(isinstance(labels, memoryview) and labels.format == 'I'
+                       for labels in grid.sector_grid)
+        assert bytes(cached.tile_array()) == bytes(built.tile_array())
+        for size in range(1, MAX_SIZE + 1):
+            assert bytes(cached.sectors(size)) == bytes(built.sectors(size))
+
+        # editing a grid that is mapped from the cache leaves the file as it was
+        with open(cache, 'rb') as f:
+            before = f.read()
+        tile = (10, 10)
+        cached.set(tile, (cached.get(tile) + 1) % len(TILE_COLOR))
+        with open(cache, 'rb') as f:
+            assert f.read() == before
+        cached.save_map(os.path.join(directory, 'edited.bmap'))
+        fresh = grid_student.Grid(os.path.join(directory, 'edited.bmap'))
+        for size in range(1, MAX_SIZE + 1):
+            assert_same_sectors(cached.sectors(size), fresh.sectors(size))
+
+        # a cache built from a different version of the map file is rebuilt
+        with open(filename, 'rb') as f:
+            rows = f.read().splitlines()
+        rows[10] = rows[10][:10] + (b'1' if rows[10][10:11] != b'1' else b'2') + rows[10][11:]
+        with open(filename, 'wb') as f:
+            f.write(b'\n'.join(rows) + b'\n')
+        rebuilt = grid_student.Grid(filename)
+        assert os.stat(cache).st_ino != inode
+        assert rebuilt.get(tile) == int(rows[10][10:11])
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, "passed")